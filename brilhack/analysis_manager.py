@@ -0,0 +1,120 @@
+"""Registry of function analyses, and a per-function cache of their results.
+
+Analyses are functions taking a basic_blocks.Function, registered by name with
+the @analysis decorator. The modules of this package registering analyses are
+imported on first use of one of their analyses, see get_analysis().
+`func.analyses.get(name)` computes an analysis at most once, until the function
+changes:
+
+  * Changing the instructions of a block drops all results except those of
+    analyses registered with cfg_only=True (dominators, loops, ...).
+  * Changing the CFG drops all results.
+
+Transforms that return a new Function declare which analyses they preserve with
+the @transform decorator, so that results cached on their input carry over to
+their output.
+
+Cached results are shared, and must not be mutated by callers.
+"""
+import functools
+import importlib
+
+# Map from analysis name to the function computing it.
+ALL_ANALYSES = {}
+
+# Map from analysis name to the module of this package registering it, so that
+# analyses can be looked up without importing their modules first.
+_PROVIDERS = {
+    'predecessors': 'global_analysis',
+    'rpo': 'global_analysis',
+    'idom': 'global_analysis',
+    'dominators': 'global_analysis',
+    'dominance': 'global_analysis',
+    'irreducible_regions': 'global_analysis',
+    'loop_forest': 'global_analysis',
+    'loops': 'global_analysis',
+    'reaching_defs': 'dataflow',
+    'live_vars': 'dataflow',
+    'def_use': 'def_use',
+}
+
+# Names of analyses whose results depend only on the CFG of a function.
+CFG_ANALYSES = set()
+
+
+def analysis(name, cfg_only=False):
+    def decorator(func):
+        ALL_ANALYSES[name] = func
+        if cfg_only:
+            CFG_ANALYSES.add(name)
+        return func
+
+    return decorator
+
+
+def get_analysis(name):
+    """Returns the function computing analysis `name`, importing the module
+    registering it if needed."""
+    try:
+        return ALL_ANALYSES[name]
+    except KeyError:
+        pass
+    if name not in _PROVIDERS:
+        raise KeyError('Unknown analysis {!r}: import the module registering '
+                       'it first'.format(name))
+    importlib.import_module('.' + _PROVIDERS[name], __package__)
+    return ALL_ANALYSES[name]
+
+
+def analysis_names():
+    """Returns the names of all known analyses."""
+    return sorted(set(ALL_ANALYSES) | set(_PROVIDERS))
+
+
+class AnalysisManager:
+    def __init__(self, func):
+        self.func = func
+        self._results = {}
+
+    def get(self, name):
+        """Returns the result of analysis `name` on the function."""
+        try:
+            return self._results[name]
+        except KeyError:
+            result = self._results[name] = get_analysis(name)(self.func)
+            return result
+
+    def is_cached(self, name) -> bool:
+        return name in self._results
+
+    def invalidate(self, preserved=()):
+        """Drops all cached results, except for analyses in `preserved`."""
+        self._results = {
+            name: result
+            for name, result in self._results.items() if name in preserved
+        }
+
+    def carry_over(self, other, preserved):
+        """Adopts the results cached by AnalysisManager `other` for the
+        analyses in `preserved`, unless already computed here."""
+        for name in preserved:
+            if name in other._results and name not in self._results:
+                self._results[name] = other._results[name]
+
+
+def transform(preserves=()):
+    """Decorator for transforms that take a Function (and possibly other
+    arguments) and return the transformed Function. The analyses named in
+    `preserves` have the same results on the returned function as on the input,
+    so their cached results carry over."""
+    def decorator(transform_func):
+        @functools.wraps(transform_func)
+        def wrapper(func, *args, **kwargs):
+            optfunc = transform_func(func, *args, **kwargs)
+            if optfunc is not func:
+                optfunc.analyses.carry_over(func.analyses, preserves)
+            return optfunc
+
+        return wrapper
+
+    return decorator
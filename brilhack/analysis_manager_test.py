@@ -0,0 +1,153 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from .analysis_manager import (ALL_ANALYSES, CFG_ANALYSES, analysis,
+                               analysis_names, get_analysis, transform)
+from .basic_blocks import BBProgram, Function
+from . import global_analysis
+from . import parser
+
+_computed = []
+
+
+@analysis('__test_num_instrs')
+def _num_instrs(func):
+    _computed.append('num_instrs')
+    return sum(len(block) for block in func.blocks)
+
+
+@analysis('__test_num_edges', cfg_only=True)
+def _num_edges(func):
+    _computed.append('num_edges')
+    return func.cfg.num_edges
+
+
+class AnalysisManagerTest(unittest.TestCase):
+    def setUp(self):
+        del _computed[:]
+        self.main = BBProgram(prog=parser.parse("""
+          @main(n: int) {
+            i: int = const 0;
+            .loop:
+            one: int = const 1;
+            i: int = add i one;
+            c: bool = lt i n;
+            br c .loop .done;
+            .done:
+            print i;
+          }""")).funcs['main']
+
+    def test_registry(self):
+        for name in ('predecessors', 'rpo', 'idom', 'dominators', 'loops',
+                     'reaching_defs', 'def_use', 'live_vars'):
+            self.assertIn(name, ALL_ANALYSES)
+        for name in ('predecessors', 'rpo', 'idom', 'dominators', 'dominance',
+                     'loops'):
+            self.assertIn(name, CFG_ANALYSES)
+        for name in ('reaching_defs', 'def_use', 'live_vars'):
+            self.assertNotIn(name, CFG_ANALYSES)
+        self.assertEqual(self.main.analyses.get('loops'), [(1, {1})])
+        self.assertEqual(self.main.analyses.get('rpo'), [0, 1, 2, 3])
+
+    def test_analyses_are_found_without_importing_their_modules(self):
+        for name in analysis_names():
+            self.assertIs(get_analysis(name), ALL_ANALYSES[name])
+        # In a fresh interpreter, where only basic_blocks is imported.
+        out = subprocess.run([
+            sys.executable, '-c', 'from brilhack.basic_blocks import Function;'
+            'f = Function("main", [], instrs=[{"op": "nop"}]);'
+            'print(f.analyses.get("dominators"), f.analyses.get("live_vars"))'
+        ],
+                             cwd=os.path.dirname(os.path.dirname(__file__)),
+                             check=True,
+                             capture_output=True,
+                             text=True).stdout
+        self.assertTrue(out.startswith('[{0}, {0, 1}]'))
+        with self.assertRaisesRegex(KeyError, 'import the module'):
+            self.main.analyses.get('__test_unknown')
+
+    def test_results_are_memoized(self):
+        analyses = self.main.analyses
+        self.assertEqual(analyses.get('__test_num_instrs'), 8)
+        self.assertEqual(analyses.get('__test_num_instrs'), 8)
+        self.assertEqual(analyses.get('__test_num_edges'), 4)
+        self.assertEqual(analyses.get('__test_num_edges'), 4)
+        self.assertEqual(_computed, ['num_instrs', 'num_edges'])
+
+    def test_changing_instructions_keeps_cfg_analyses(self):
+        analyses = self.main.analyses
+        analyses.get('__test_num_instrs')
+        analyses.get('__test_num_edges')
+        self.main.mutable_block(2).pop()
+        self.assertFalse(analyses.is_cached('__test_num_instrs'))
+        self.assertTrue(analyses.is_cached('__test_num_edges'))
+        self.assertEqual(analyses.get('__test_num_instrs'), 7)
+
+        self.main.set_block(2, [])
+        self.assertFalse(analyses.is_cached('__test_num_instrs'))
+        self.assertTrue(analyses.is_cached('__test_num_edges'))
+
+    def test_changing_cfg_drops_all(self):
+        analyses = self.main.analyses
+        analyses.get('__test_num_instrs')
+        analyses.get('__test_num_edges')
+        self.main.set_block_exits(0, [2])
+        self.assertFalse(analyses.is_cached('__test_num_instrs'))
+        self.assertFalse(analyses.is_cached('__test_num_edges'))
+
+        analyses.get('__test_num_edges')
+        self.main.append_block([], [])
+        self.assertFalse(analyses.is_cached('__test_num_edges'))
+
+    def test_copies_carry_over_valid_results(self):
+        self.main.analyses.get('__test_num_instrs')
+        self.main.analyses.get('__test_num_edges')
+
+        copy = self.main.copy()
+        self.assertFalse(copy.analyses.is_cached('__test_num_instrs'))
+        self.assertTrue(copy.analyses.is_cached('__test_num_edges'))
+
+        filtered = Function.filter_copy(self.main, exclude={(2, 0)})
+        self.assertFalse(filtered.analyses.is_cached('__test_num_instrs'))
+        self.assertTrue(filtered.analyses.is_cached('__test_num_edges'))
+
+    def test_copies_do_not_see_changes_to_the_original(self):
+        self.main.analyses.get('live_vars')
+        copy = self.main.copy()
+        del self.main.mutable_block(1)[1]
+        liveness = copy.analyses.get('live_vars')
+        self.assertEqual(liveness.names(liveness.live_after(1, 1)),
+                         {'i', 'n', 'one'})
+        self.assertEqual(liveness.names(liveness.live_after(1, 4)), {'i', 'n'})
+
+    def test_transform_preserves(self):
+        @transform(preserves=CFG_ANALYSES)
+        def drop_prints(func):
+            func = Function.filter_copy(func)
+            func.set_block(2, [])
+            return func
+
+        @transform()
+        def reset(func):
+            return Function.from_bril(func.to_bril())
+
+        self.main.analyses.get('__test_num_edges')
+        self.assertTrue(
+            drop_prints(self.main).analyses.is_cached('__test_num_edges'))
+        self.assertFalse(
+            reset(self.main).analyses.is_cached('__test_num_edges'))
+
+    def test_licm_computes_dominators_once(self):
+        with mock.patch.object(
+                global_analysis,
+                'immediate_dominators',
+                wraps=global_analysis.immediate_dominators) as doms:
+            global_analysis.loop_invariant_code_motion(self.main)
+        self.assertEqual(doms.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
-import copy
+from collections.abc import MutableMapping
 
+from .analysis_manager import AnalysisManager, CFG_ANALYSES
+from .cfg import CFG
+from .instr import Instr
 from .util import is_terminator, is_label, mklabel
 
 
@@ -9,6 +12,7 @@ def _make_blocks(instrs):
 
     curr_block = []
     for instr in instrs:
+        instr = Instr.from_bril(instr)
         if not is_label(instr):
             curr_block.append(instr)
 
@@ -34,7 +38,7 @@ def _build_cfg(blocks, label_index):
     for i, block in enumerate(blocks):
         last = block[-1]
         if is_terminator(last):
-            next_blocks = [label_index[label] for label in last['labels']]
+            next_blocks = [label_index[label] for label in last.labels]
         else:
             next_blocks = [i + 1]
         cfg.append(next_blocks)
@@ -47,6 +51,44 @@ def _build_cfg(blocks, label_index):
     return cfg
 
 
+class SymbolTable:
+    """Interns the variable names of a function to dense integer ids.
+
+    Function arguments get ids 0..len(args)-1, in order. Ids are never reused or
+    removed, so analyses can size lists and bitsets by len(symbols).
+    """
+    def __init__(self, args=()):
+        self.names = []
+        self.ids = {}
+        for arg in args:
+            self.intern(arg['name'])
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name: str) -> int:
+        id_ = self.ids.get(name)
+        if id_ is None:
+            id_ = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return id_
+
+    def bind(self, instr):
+        """Sets instr.dest_id and instr.arg_ids from instr's names, and keeps
+        them in sync with later assignments to instr.dest and instr.args."""
+        instr.symbols = self
+        if instr.dest is not None:
+            instr.dest_id = self.intern(instr.dest)
+        if instr.args is not None:
+            instr.arg_ids = tuple(self.intern(arg) for arg in instr.args)
+
+    def ensure_bound(self, instr):
+        """Binds `instr` unless it already is bound to this table, e.g. when it
+        was inserted into a block returned by Function.mutable_block()."""
+        if instr.symbols is not self:
+            self.bind(instr)
+
+
 class Function:
     def __init__(self,
                  name,
@@ -54,18 +96,37 @@ class Function:
                  instrs=None,
                  blocks=None,
                  label_index=None,
-                 block_exits=None):
+                 block_exits=None,
+                 symbols=None):
         self.name = name
 
         assert (instrs is None) ^ (blocks is None and label_index is None),\
             "Either instrs, or (blocks and label_index and block_exits) must be given"
         if instrs is not None:
             self.blocks, self.label_index = _make_blocks(instrs)
+            owned = 1
         else:
-            self.blocks = blocks
+            self.blocks = [[Instr.from_bril(instr) for instr in block]
+                           for block in blocks]
             self.label_index = label_index
+            owned = 0
         self.args = args
 
+        # Blocks are copy-on-write: clones share block lists and instructions
+        # until one of them mutates a block, see mutable_block().
+        # _owned[block_idx] is set if this function has the only reference to
+        # that block and its instructions.
+        self._owned = bytearray([owned]) * len(self.blocks)
+
+        # Variable names are interned once per function. Clones share the
+        # table, since interning only ever appends to it.
+        if symbols is None:
+            symbols = SymbolTable(args)
+            for block in self.blocks:
+                for instr in block:
+                    symbols.bind(instr)
+        self.symbols = symbols
+
         # Control flow information.
         # Map from block index to a list of block indices where control can
         # reach from it.
@@ -73,44 +134,270 @@ class Function:
             self.block_exits = _build_cfg(self.blocks, self.label_index)
         else:
             self.block_exits = block_exits
+        # CFG built from block_exits on first use, see the `cfg` property.
+        self._cfg = None
+
+        # Per-block summaries computed by analyses, see block_summary().
+        # _summaries[kind][block_idx] is None when not computed, or stale.
+        self._summaries = {}
+
+        # Cache of analysis results, see the `analyses` property.
+        self._analyses = None
+
+    @property
+    def analyses(self) -> AnalysisManager:
+        """The AnalysisManager caching analysis results for this function.
+
+        Results are dropped when the function changes through mutable_block(),
+        set_block(), set_block_exits(), append_block() or insert_block(); code
+        changing blocks in other ways must call analyses.invalidate() itself.
+        """
+        if self._analyses is None:
+            self._analyses = AnalysisManager(self)
+        return self._analyses
+
+    @property
+    def cfg(self) -> CFG:
+        """The control flow graph of this function, as a CFG object.
+
+        Built once from block_exits. Code changing block_exits must do so with
+        set_block_exits(), append_block() or insert_block(), which keep it up
+        to date.
+        """
+        if self._cfg is None:
+            self._cfg = CFG(self.block_exits)
+        return self._cfg
+
+    def set_block_exits(self, block_idx, exits):
+        self.block_exits[block_idx] = exits
+        self._cfg = None
+        if self._analyses is not None:
+            self._analyses.invalidate()
+
+    def block_summary(self, kind, block_idx, compute):
+        """Returns compute(self, block_idx), computed once per `kind` and kept
+        until block `block_idx` changes.
+
+        Summaries may depend only on the instructions of the block and on the
+        symbol table, since they are kept across copies of the function.
+        """
+        summaries = self._summaries.get(kind)
+        if summaries is None:
+            summaries = self._summaries[kind] = [None] * len(self.blocks)
+        summary = summaries[block_idx]
+        if summary is None:
+            summary = summaries[block_idx] = compute(self, block_idx)
+        return summary
+
+    def _block_changed(self, block_idx):
+        for summaries in self._summaries.values():
+            summaries[block_idx] = None
+        if self._analyses is not None:
+            self._analyses.invalidate(preserved=CFG_ANALYSES)
+
+    @classmethod
+    def from_bril(cls, bril_func):
+        """Builds a Function from its Bril JSON dict."""
+        return cls(name=bril_func['name'],
+                   args=bril_func.get('args', []),
+                   instrs=bril_func['instrs'])
 
     def to_bril(self):
         return {
             'name': self.name,
             'args': self.args,
-            'instrs': [instr for block in self.blocks for instr in block]
+            'instrs':
+            [instr.to_bril() for block in self.blocks for instr in block]
         }
 
+    def mutable_block(self, block_idx):
+        """Returns block `block_idx` for in-place modification, first copying
+        it (and its instructions) if it is shared with a clone."""
+        if not self._owned[block_idx]:
+            self.blocks[block_idx] = [
+                instr.copy() for instr in self.blocks[block_idx]
+            ]
+            self._owned[block_idx] = 1
+        # The caller is about to change the block.
+        self._block_changed(block_idx)
+        return self.blocks[block_idx]
+
+    def set_block(self, block_idx, block):
+        """Replaces block `block_idx`. `block` may share instructions with
+        other blocks or functions."""
+        for instr in block:
+            self.symbols.bind(instr)
+        self.blocks[block_idx] = block
+        self._owned[block_idx] = 0
+        self._block_changed(block_idx)
+
+    def append_block(self, block, exits):
+        """Appends `block`, which continues to the blocks in `exits`. Returns
+        the index of the new block.
+
+        If the function has a dummy exit node, it stays the last node of the
+        CFG, and edges into it are renumbered.
+        """
+        for instr in block:
+            self.symbols.bind(instr)
+        block_idx = len(self.blocks)
+        if len(self.block_exits) > block_idx:
+            for i, succs in enumerate(self.block_exits):
+                if block_idx in succs:
+                    self.block_exits[i] = [
+                        succ + 1 if succ == block_idx else succ
+                        for succ in succs
+                    ]
+            self.block_exits.insert(block_idx, exits)
+        else:
+            self.block_exits.append(exits)
+        self.blocks.append(block)
+        self._owned.append(0)
+        for summaries in self._summaries.values():
+            summaries.append(None)
+        self._cfg = None
+        if self._analyses is not None:
+            self._analyses.invalidate()
+        return block_idx
+
+    def insert_block(self, block_idx, block, exits):
+        """Inserts `block` before block `block_idx`, continuing to the blocks
+        in `exits`. Blocks from `block_idx` on, including the dummy exit node,
+        are renumbered up by one, and `exits` must use the new numbering.
+
+        Blocks falling through into block `block_idx` now fall through into
+        `block`: callers must fix up their instructions and exits.
+        """
+        for instr in block:
+            self.symbols.bind(instr)
+        for i, succs in enumerate(self.block_exits):
+            if any(succ >= block_idx for succ in succs):
+                self.block_exits[i] = [
+                    succ + 1 if succ >= block_idx else succ for succ in succs
+                ]
+        self.block_exits.insert(block_idx, exits)
+        for label, idx in self.label_index.items():
+            if idx >= block_idx:
+                self.label_index[label] = idx + 1
+        if block and block[0].label is not None:
+            self.label_index[block[0].label] = block_idx
+        self.blocks.insert(block_idx, block)
+        self._owned.insert(block_idx, 0)
+        for summaries in self._summaries.values():
+            summaries.insert(block_idx, None)
+        self._cfg = None
+        if self._analyses is not None:
+            self._analyses.invalidate()
+
     @classmethod
     def filter_copy(cls, other, exclude=None):
         """`exclude` is a set of (block_idx, instr_idx) pairs which are
-        excluded from the copy."""
+        excluded from the copy.
+
+        The copy shares all blocks without excluded instructions with `other`,
+        and instructions are never copied: blocks are copied lazily when either
+        function mutates them.
+        """
         f = cls(name=other.name,
                 args=other.args,
                 blocks=[],
-                label_index=copy.deepcopy(other.label_index),
-                block_exits=copy.deepcopy(other.block_exits))
-        for block_idx, block in enumerate(other.blocks):
-            b = []
-            for instr_idx, instr in enumerate(block):
-                if not exclude or (block_idx, instr_idx) not in exclude:
-                    b.append(copy.deepcopy(instr))
-            f.blocks.append(b)
+                label_index=dict(other.label_index),
+                block_exits=[exits[:] for exits in other.block_exits],
+                symbols=other.symbols)
+        f.blocks = other.blocks[:]
+        if exclude:
+            excluded_by_block = {}
+            for block_idx, instr_idx in exclude:
+                excluded_by_block.setdefault(block_idx, set()).add(instr_idx)
+            for block_idx, excluded in excluded_by_block.items():
+                f.blocks[block_idx] = [
+                    instr
+                    for instr_idx, instr in enumerate(other.blocks[block_idx])
+                    if instr_idx not in excluded
+                ]
+
+        # Neither function may now mutate a block in place without copying it.
+        f._owned = bytearray(len(f.blocks))
+        other._owned = bytearray(len(other.blocks))
+
+        # Summaries of the shared blocks stay valid.
+        for kind, summaries in other._summaries.items():
+            f._summaries[kind] = summaries[:]
+            if exclude:
+                for block_idx in excluded_by_block:
+                    f._summaries[kind][block_idx] = None
+
+        # So do the results of analyses of the CFG, which is unchanged. Other
+        # results may refer to the instructions of `other`, which can change
+        # independently of the copy's.
+        if other._analyses is not None:
+            f.analyses.carry_over(other._analyses, CFG_ANALYSES)
         return f
 
     def copy(self):
         return self.__class__.filter_copy(self)
 
 
+class FunctionMap(MutableMapping):
+    """Ordered map from function name to Function.
+
+    Entries may also hold a function's Bril JSON dict, in which case the
+    Function (with its basic blocks and CFG) is only built the first time the
+    entry is looked up.
+    """
+    def __init__(self):
+        self._entries = {}
+
+    def __getitem__(self, name) -> Function:
+        entry = self._entries[name]
+        if not isinstance(entry, Function):
+            entry = self._entries[name] = Function.from_bril(entry)
+        return entry
+
+    def __setitem__(self, name, func: Function):
+        self._entries[name] = func
+
+    def __delitem__(self, name):
+        del self._entries[name]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def set_bril(self, name, bril_func):
+        """Adds the function with Bril JSON `bril_func`, without building it."""
+        self._entries[name] = bril_func
+
+    def bril(self, name):
+        """Returns the Bril JSON of function `name`, without building it."""
+        entry = self._entries[name]
+        if isinstance(entry, Function):
+            return entry.to_bril()
+        return entry
+
+    def is_materialized(self, name) -> bool:
+        return isinstance(self._entries[name], Function)
+
+
 class BBProgram:
-    def __init__(self, prog=None):
+    def __init__(self, prog=None, lazy=False):
+        """If `lazy` is set, a function's basic blocks are only built when it
+        is looked up in `funcs`."""
         # Map from function to list of basic blocks in it.
-        self.funcs = {}
+        self.funcs = FunctionMap()
         if prog is not None:
             for func in prog['functions']:
-                self.funcs[func['name']] = Function(name=func['name'],
-                                                    args=func.get('args', []),
-                                                    instrs=func['instrs'])
+                self.funcs.set_bril(func['name'], func)
+                if not lazy:
+                    # Looking the function up builds it.
+                    self.funcs[func['name']]
 
     def bril_dict(self):
-        return {'functions': [func.to_bril() for func in self.funcs.values()]}
+        return {
+            'functions': [self.funcs.bril(name) for name in self.funcs]
+        }
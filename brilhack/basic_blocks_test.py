@@ -1,6 +1,8 @@
 import unittest
 from .basic_blocks import BBProgram
+from .instr import Instr
 from . import parser
+from .util import mkjmp, mklabel
 
 
 class BBProgramTest(unittest.TestCase):
@@ -19,6 +21,128 @@ class BBProgramTest(unittest.TestCase):
         self.assertEqual(copy.label_index, main.label_index)
         self.assertEqual(copy.block_exits, main.block_exits)
 
+    def test_function_copy_is_copy_on_write(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main() {
+            v: int = const 4;
+            jmp .somewhere;
+            v: int = const 2;
+            .somewhere:
+            print v;
+          }"""))
+        main = bbprog.funcs['main']
+        copy = main.copy()
+        for block, copied_block in zip(main.blocks, copy.blocks):
+            self.assertIs(block, copied_block)
+
+        copy.mutable_block(0)[1]['labels'] = ['elsewhere']
+        self.assertIsNot(copy.blocks[0], main.blocks[0])
+        self.assertIs(copy.blocks[1], main.blocks[1])
+        self.assertEqual(main.blocks[0][1], {
+            "labels": ["somewhere"],
+            "op": "jmp"
+        })
+
+        # The original must not mutate blocks it now shares with the copy.
+        main.mutable_block(1)[0]['value'] = 3
+        self.assertEqual(copy.blocks[1][0]['value'], 2)
+
+    def test_filter_copy_only_rebuilds_filtered_blocks(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main() {
+            v: int = const 4;
+            jmp .somewhere;
+            v: int = const 2;
+            .somewhere:
+            print v;
+          }"""))
+        main = bbprog.funcs['main']
+        copy = main.filter_copy(main, exclude={(1, 0)})
+        self.assertEqual(copy.blocks[1], [])
+        self.assertEqual(len(main.blocks[1]), 1)
+        self.assertIs(copy.blocks[0], main.blocks[0])
+        self.assertIs(copy.blocks[2], main.blocks[2])
+
+    def test_append_block_keeps_dummy_exit_last(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main() {
+            .entry:
+            print;
+          }"""))
+        main = bbprog.funcs['main']
+        self.assertEqual(main.block_exits, [[1], []])
+        self.assertEqual(main.append_block([], [0]), 1)
+        self.assertEqual(main.block_exits, [[2], [0], []])
+
+    def test_insert_block_renumbers_later_blocks(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(x: bool) {
+            .a:
+            br x .a .b;
+            .b:
+            print x;
+          }"""))
+        main = bbprog.funcs['main']
+        self.assertEqual(main.block_exits, [[0, 1], [2], []])
+        main.insert_block(1, [mklabel('new'), mkjmp('b')], [2])
+        self.assertEqual(main.block_exits, [[0, 2], [2], [3], []])
+        self.assertEqual(main.label_index, {'a': 0, 'new': 1, 'b': 2})
+        self.assertEqual(main.cfg.succ_lists(), [[0, 2], [2], [3], []])
+
+    def test_cfg_follows_block_exits(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main() {
+            .entry:
+            print;
+          }"""))
+        main = bbprog.funcs['main']
+        cfg = main.cfg
+        self.assertIs(main.cfg, cfg)
+        self.assertEqual(cfg.succ_lists(), [[1], []])
+
+        main.append_block([], [0])
+        self.assertEqual(main.cfg.succ_lists(), [[2], [0], []])
+        main.set_block_exits(1, [1])
+        self.assertEqual(main.cfg.pred_lists(), [[], [1], [0]])
+
+    def test_block_summaries(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main() {
+            v: int = const 4;
+            jmp .somewhere;
+            v: int = const 2;
+            .somewhere:
+            print v;
+          }"""))
+        main = bbprog.funcs['main']
+        computed = []
+
+        def count_instrs(func, block_idx):
+            computed.append(block_idx)
+            return len(func.blocks[block_idx])
+
+        summaries = [
+            main.block_summary('count', i, count_instrs) for i in range(3)
+        ]
+        self.assertEqual(summaries, [2, 1, 2])
+        main.block_summary('count', 0, count_instrs)
+        self.assertEqual(computed, [0, 1, 2])
+
+        # Copies keep the summaries of the blocks they share.
+        copy = main.filter_copy(main, exclude={(2, 1)})
+        self.assertEqual(copy.block_summary('count', 0, count_instrs), 2)
+        self.assertEqual(copy.block_summary('count', 2, count_instrs), 1)
+        self.assertEqual(computed, [0, 1, 2, 2])
+
+        # Changing a block drops its summary.
+        main.mutable_block(1).append(main.blocks[1][0].copy())
+        self.assertEqual(main.block_summary('count', 1, count_instrs), 2)
+        main.set_block(0, [])
+        self.assertEqual(main.block_summary('count', 0, count_instrs), 0)
+        main.append_block([], [])
+        self.assertEqual(main.block_summary('count', 3, count_instrs), 0)
+        self.assertEqual(computed, [0, 1, 2, 2, 1, 0, 3])
+
     def test_bbprogram(self):
         bbprog = BBProgram(prog=parser.parse("""
           @main() {
@@ -60,6 +184,76 @@ class BBProgramTest(unittest.TestCase):
         # actually a dummy block with no successors.
         self.assertEqual(main_func.block_exits, [[2], [2], [3], []])
 
+    def test_symbol_table(self):
+        prog = parser.parse("""
+          @main(n: int) {
+            v: int = const 4;
+            s: int = add v n;
+            v: int = add s s;
+            print v;
+          }""")
+        main = BBProgram(prog).funcs['main']
+        symbols = main.symbols
+        self.assertEqual(symbols.names, ['n', 'v', 's'])
+        [block] = main.blocks
+        self.assertEqual([instr.dest_id for instr in block],
+                         [1, 2, 1, None])
+        self.assertEqual([instr.arg_ids for instr in block],
+                         [None, (1, 0), (2, 2), (1, )])
+        self.assertEqual(main.copy().symbols, symbols)
+        self.assertEqual(main.to_bril()['instrs'],
+                         prog['functions'][0]['instrs'])
+
+    def test_assignments_rebind_symbols(self):
+        main = BBProgram(prog=parser.parse("""
+          @main(n: int) {
+            a: int = const 1;
+            b: int = const 2;
+            c: int = add a a;
+            print c;
+          }""")).funcs['main']
+        instr = main.mutable_block(0)[2]
+        instr['args'] = ['b', 'b']
+        self.assertEqual(instr.arg_ids, (2, 2))
+        instr['dest'] = 'd'
+        self.assertEqual(instr.dest_id, 4)
+        self.assertEqual(main.symbols.names, ['n', 'a', 'b', 'c', 'd'])
+        del instr['args']
+        self.assertIsNone(instr.arg_ids)
+        instr.args = ['a', 'n']
+        self.assertEqual(instr.arg_ids, (1, 0))
+        instr.dest = 'c'
+        self.assertEqual(instr.dest_id, 3)
+
+        inserted = Instr.from_bril({'op': 'print', 'args': ['c']})
+        self.assertIsNone(inserted.arg_ids)
+        main.symbols.ensure_bound(inserted)
+        self.assertEqual(inserted.arg_ids, (3, ))
+
+    def test_lazy_bbprogram(self):
+        prog = parser.parse("""
+          @main() {
+            v: int = const 4;
+            print v;
+          }
+          @other(): int {
+            v: int = const 2;
+            ret v;
+          }""")
+        bbprog = BBProgram(prog, lazy=True)
+        self.assertEqual(list(bbprog.funcs), ['main', 'other'])
+        self.assertFalse(bbprog.funcs.is_materialized('main'))
+
+        main = bbprog.funcs['main']
+        self.assertIs(bbprog.funcs['main'], main)
+        self.assertTrue(bbprog.funcs.is_materialized('main'))
+        self.assertFalse(bbprog.funcs.is_materialized('other'))
+
+        bril = bbprog.bril_dict()
+        self.assertEqual(bril['functions'][0], main.to_bril())
+        self.assertIs(bril['functions'][1], prog['functions'][1])
+        self.assertFalse(bbprog.funcs.is_materialized('other'))
+
 
 if __name__ == '__main__':
     unittest.main()
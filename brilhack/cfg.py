@@ -0,0 +1,210 @@
+"""Compact control flow graph representation.
+
+A `CFG` stores successor and predecessor adjacency of nodes 0..n-1 in
+compressed sparse row (CSR) form: the successors of node i are
+`succ[succ_start[i]:succ_start[i + 1]]`, and likewise for predecessors. The
+graph is immutable; `basic_blocks.Function` rebuilds it lazily when its
+`block_exits` change.
+
+Traversals are done by `DFS`, which computes the preorder, postorder and back
+edges of a depth-first search in one pass with an explicit stack, so that deep
+CFGs do not hit the recursion limit. `CFG.dfs()` caches the DFS of the whole
+graph.
+"""
+from array import array
+from typing import List
+
+
+def _csr(adjlist, num_nodes):
+    start = array('i', bytes(4 * (num_nodes + 1)))
+    for i, targets in enumerate(adjlist):
+        start[i + 1] = start[i] + len(targets)
+    flat = array('i')
+    for targets in adjlist:
+        flat.extend(targets)
+    return start, flat
+
+
+class DFS:
+    """A depth-first search of `cfg`, started at each of `roots` in turn that
+    is not visited yet. Successors are visited in order.
+
+    By default the roots are node 0, then every other node in index order, so
+    that all nodes are visited, and those reachable from node 0 first.
+
+    Attributes:
+      preorder, postorder: arrays of the visited nodes in DFS preorder and
+      postorder.
+      pre_num, post_num: arrays mapping each node to its index in preorder
+      and postorder, or -1 if it was not visited.
+      back_edges: list of (tail, head) pairs for the edges tail->head to a node
+      whose DFS had not finished yet, in the order they were found.
+      num_from_first_root: the number of nodes reachable from the first root.
+    """
+    def __init__(self, cfg, roots=None):
+        n = cfg.num_nodes
+        if roots is None:
+            roots = range(n)
+        succ_start, succ = cfg.succ_start, cfg.succ
+        preorder = array('i')
+        postorder = array('i')
+        pre_num = array('i', [-1]) * n
+        post_num = array('i', [-1]) * n
+        back_edges = []
+        num_from_first_root = None
+        for root in roots:
+            if pre_num[root] == -1:
+                pre_num[root] = len(preorder)
+                preorder.append(root)
+                # Stack of (node, index into succ of the next succ to visit).
+                stack = [(root, succ_start[root])]
+                while stack:
+                    node, i = stack[-1]
+                    if i < succ_start[node + 1]:
+                        stack[-1] = (node, i + 1)
+                        target = succ[i]
+                        if pre_num[target] == -1:
+                            pre_num[target] = len(preorder)
+                            preorder.append(target)
+                            stack.append((target, succ_start[target]))
+                        elif post_num[target] == -1:
+                            back_edges.append((node, target))
+                    else:
+                        stack.pop()
+                        post_num[node] = len(postorder)
+                        postorder.append(node)
+            if num_from_first_root is None:
+                num_from_first_root = len(preorder)
+        self.preorder = preorder
+        self.postorder = postorder
+        self.pre_num = pre_num
+        self.post_num = post_num
+        self.back_edges = back_edges
+        self.num_from_first_root = num_from_first_root or 0
+
+    def visited(self, node: int) -> bool:
+        return self.pre_num[node] != -1
+
+    def reachable_from_first_root(self, node: int) -> bool:
+        return 0 <= self.pre_num[node] < self.num_from_first_root
+
+
+class CFG:
+    def __init__(self, adjlist: List[List[int]]):
+        """Builds a CFG from `adjlist`, where adjlist[i] lists the successors of
+        node i."""
+        n = len(adjlist)
+        self.num_nodes = n
+        self.succ_start, self.succ = _csr(adjlist, n)
+
+        # Counting sort of the edges by target, which keeps the predecessors
+        # of each node in increasing order.
+        pred_start = array('i', bytes(4 * (n + 1)))
+        for target in self.succ:
+            pred_start[target + 1] += 1
+        for i in range(n):
+            pred_start[i + 1] += pred_start[i]
+        pred = array('i', bytes(4 * len(self.succ)))
+        fill = pred_start[:-1]
+        for src, targets in enumerate(adjlist):
+            for target in targets:
+                pred[fill[target]] = src
+                fill[target] += 1
+        self.pred_start = pred_start
+        self.pred = pred
+        self._dfs = None
+
+    @classmethod
+    def of(cls, cfg):
+        """Returns `cfg` if it is a CFG, else a CFG for the adjlist `cfg`."""
+        if isinstance(cfg, cls):
+            return cfg
+        return cls(cfg)
+
+    def __len__(self):
+        return self.num_nodes
+
+    @property
+    def num_edges(self):
+        return len(self.succ)
+
+    def succs(self, node: int):
+        return self.succ[self.succ_start[node]:self.succ_start[node + 1]]
+
+    def preds(self, node: int):
+        return self.pred[self.pred_start[node]:self.pred_start[node + 1]]
+
+    def succ_lists(self) -> List[List[int]]:
+        return [list(self.succs(i)) for i in range(self.num_nodes)]
+
+    def pred_lists(self) -> List[List[int]]:
+        return [list(self.preds(i)) for i in range(self.num_nodes)]
+
+    def dfs(self) -> DFS:
+        """Returns the DFS from node 0, then from each node not visited yet, in
+        index order. Node 0 is the entry, so the nodes reachable from the
+        entry are visited first."""
+        if self._dfs is None:
+            self._dfs = DFS(self)
+        return self._dfs
+
+    def reachable_from_entry(self, node: int) -> bool:
+        return self.dfs().reachable_from_first_root(node)
+
+    def postorder(self):
+        """Returns the nodes in the postorder of dfs(), as an array."""
+        return self.dfs().postorder
+
+    def reverse_postorder(self):
+        return self.postorder()[::-1]
+
+    def sccs(self) -> List[array]:
+        """Returns the strongly connected components of the graph, as arrays of
+        nodes, in reverse topological order (Tarjan's algorithm, with an
+        explicit stack)."""
+        n = self.num_nodes
+        succ_start, succ = self.succ_start, self.succ
+        index = array('i', [-1]) * n
+        low = array('i', [-1]) * n
+        on_stack = bytearray(n)
+        stack = []
+        components = []
+        counter = 0
+        for root in range(n):
+            if index[root] != -1:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            # Stack of (node, index into succ of the next succ to visit).
+            work = [(root, succ_start[root])]
+            while work:
+                node, i = work[-1]
+                if i < succ_start[node + 1]:
+                    work[-1] = (node, i + 1)
+                    target = succ[i]
+                    if index[target] == -1:
+                        index[target] = low[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack[target] = 1
+                        work.append((target, succ_start[target]))
+                    elif on_stack[target] and index[target] < low[node]:
+                        low[node] = index[target]
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if low[node] < low[parent]:
+                        low[parent] = low[node]
+                if low[node] == index[node]:
+                    component = array('i')
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+        return components
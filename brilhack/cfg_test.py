@@ -0,0 +1,78 @@
+import unittest
+from .cfg import CFG, DFS
+
+
+class CFGTest(unittest.TestCase):
+    def test_csr_adjacency(self):
+        adjlist = [[1], [5, 2], [3, 4], [4], [1], [6], []]
+        cfg = CFG(adjlist)
+        self.assertEqual(len(cfg), 7)
+        self.assertEqual(cfg.num_edges, 8)
+        self.assertEqual(cfg.succ_lists(), adjlist)
+        self.assertEqual(cfg.pred_lists(),
+                         [[], [0, 4], [1], [2], [2, 3], [1], [5]])
+        self.assertEqual(list(cfg.succs(1)), [5, 2])
+        self.assertEqual(list(cfg.preds(4)), [2, 3])
+
+    def test_of(self):
+        cfg = CFG([[1], []])
+        self.assertIs(CFG.of(cfg), cfg)
+        self.assertEqual(CFG.of([[1], []]).succ_lists(), [[1], []])
+
+    def test_postorder(self):
+        cfg = CFG([[1], [5, 2], [3, 4], [4], [1], [6], [], [0]])
+        self.assertEqual(list(cfg.postorder()), [6, 5, 4, 3, 2, 1, 0, 7])
+        self.assertEqual(list(cfg.reverse_postorder()),
+                         [7, 0, 1, 2, 3, 4, 5, 6])
+
+    def test_postorder_of_long_chain(self):
+        n = 100000
+        cfg = CFG([[i + 1] for i in range(n - 1)] + [[]])
+        self.assertEqual(list(cfg.postorder()), list(range(n - 1, -1, -1)))
+
+    def test_dfs(self):
+        cfg = CFG([[1], [5, 2], [3, 4], [4], [1], [6], [], [3, 7]])
+        dfs = cfg.dfs()
+        self.assertIs(cfg.dfs(), dfs)
+        self.assertEqual(list(dfs.preorder), [0, 1, 5, 6, 2, 3, 4, 7])
+        self.assertEqual(list(dfs.pre_num), [0, 1, 4, 5, 6, 2, 3, 7])
+        self.assertEqual(list(dfs.post_num), [6, 5, 4, 3, 2, 1, 0, 7])
+        self.assertEqual(dfs.back_edges, [(4, 1), (7, 7)])
+        self.assertEqual(dfs.num_from_first_root, 7)
+        self.assertTrue(cfg.reachable_from_entry(6))
+        self.assertFalse(cfg.reachable_from_entry(7))
+
+    def test_dfs_from_roots(self):
+        cfg = CFG([[1], [5, 2], [3, 4], [4], [1], [6], [], [3]])
+        dfs = DFS(cfg, roots=[2, 7])
+        self.assertEqual(list(dfs.preorder), [2, 3, 4, 1, 5, 6, 7])
+        self.assertEqual(dfs.back_edges, [(1, 2)])
+        self.assertFalse(dfs.visited(0))
+        self.assertTrue(dfs.visited(7))
+        self.assertTrue(dfs.reachable_from_first_root(6))
+        self.assertFalse(dfs.reachable_from_first_root(7))
+
+    def test_dfs_of_long_cycle(self):
+        n = 100000
+        cfg = CFG([[i + 1] for i in range(n - 1)] + [[0]])
+        dfs = cfg.dfs()
+        self.assertEqual(list(dfs.preorder), list(range(n)))
+        self.assertEqual(dfs.back_edges, [(n - 1, 0)])
+
+    def test_sccs(self):
+        cfg = CFG([[1], [5, 2], [3, 4], [4], [1], [6], [], [7, 0]])
+        self.assertEqual([sorted(c) for c in cfg.sccs()],
+                         [[6], [5], [1, 2, 3, 4], [0], [7]])
+
+        n = 100000
+        cfg = CFG([[i + 1] for i in range(n - 1)] + [[0]])
+        self.assertEqual(len(cfg.sccs()), 1)
+
+    def test_empty(self):
+        cfg = CFG([])
+        self.assertEqual(len(cfg), 0)
+        self.assertEqual(cfg.pred_lists(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
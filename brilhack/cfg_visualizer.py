@@ -3,37 +3,68 @@ Example usage (run from ../):
 
   $ bril2json <program.bril |python -mbrilhack.cfg_visualizer |dot -Tpng >program.cfg.png
 
+With --stream, functions are read and their CFGs written out one at a time, so
+that memory use is bounded by the largest function.
 """
+import argparse
 import sys
 import json
 import graphviz
 
 from .basic_blocks import BBProgram, Function
+from .stream import ProgramStream
+
+def _add_func(g, func: Function):
+  """Adds nodes and edges for the CFG of func to the graph g."""
+  invlabels = {blockid: label for label, blockid in func.label_index.items()}
+
+  def _lab(blockid):
+    return '{}/{}'.format(func.name, invlabels.get(blockid,
+      '__block_{}'.format(blockid)))
+
+  nblock = len(func.blocks)
+
+  for blockid in range(nblock):
+    g.node(_lab(blockid))
+  for blockid, succids in enumerate(func.block_exits):
+    blockname = _lab(blockid)
+    for succid in succids:
+      g.edge(blockname, _lab(succid))
+
 
 def mkdot(prog: BBProgram):
   """Returns DOT source code for CFGs of all funcs in prog."""
 
   dot = graphviz.Digraph()
   for func in prog.funcs.values():
-    invlabels = {blockid: label for label, blockid in func.label_index.items()}
+    with dot.subgraph(name=func.name) as g:
+      _add_func(g, func)
 
-    def _lab(blockid):
-      return '{}/{}'.format(func.name, invlabels.get(blockid,
-        '__block_{}'.format(blockid)))
+  return dot.source
 
-    nblock = len(func.blocks)
 
+def write_dot_stream(fin, fout):
+  """Writes DOT source code for CFGs of all funcs in the bril (JSON) program
+  read from fin, one function at a time."""
+  fout.write('digraph {\n')
+  for bril_func in ProgramStream(fin).functions():
+    func = Function.from_bril(bril_func)
+    dot = graphviz.Digraph()
     with dot.subgraph(name=func.name) as g:
-      for blockid in range(nblock):
-        g.node(_lab(blockid))
-      for blockid, succids in enumerate(func.block_exits):
-        blockname = _lab(blockid)
-        for succid in succids:
-          g.edge(blockname, _lab(succid))
-
-  return dot.source
+      _add_func(g, func)
+    fout.writelines(dot.body)
+  fout.write('}\n')
 
 
 if __name__ == '__main__':
-  p = BBProgram(json.load(sys.stdin))
-  print(mkdot(p))
\ No newline at end of file
+  parser = argparse.ArgumentParser(
+      description='Print DOT source for the CFGs of a bril (JSON) program')
+  parser.add_argument('--stream',
+                      action='store_true',
+                      help='Process one function at a time.')
+  args = parser.parse_args()
+  if args.stream:
+    write_dot_stream(sys.stdin, sys.stdout)
+  else:
+    p = BBProgram(json.load(sys.stdin))
+    print(mkdot(p))
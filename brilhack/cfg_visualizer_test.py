@@ -0,0 +1,37 @@
+import io
+import json
+import unittest
+
+from .basic_blocks import BBProgram
+from . import parser
+
+try:
+    from . import cfg_visualizer
+except ImportError:
+    cfg_visualizer = None
+
+
+@unittest.skipIf(cfg_visualizer is None, 'graphviz is not installed')
+class CfgVisualizerTest(unittest.TestCase):
+    def test_stream_matches_mkdot(self):
+        prog = parser.parse("""
+          @main(n: int) {
+            c: bool = const true;
+            br c .a .b;
+            .a:
+            print n;
+            .b:
+            ret;
+          }
+          @other {
+            .loop:
+            jmp .loop;
+          }""")
+        fout = io.StringIO()
+        cfg_visualizer.write_dot_stream(io.StringIO(json.dumps(prog)), fout)
+        self.assertEqual(fout.getvalue(),
+                         cfg_visualizer.mkdot(BBProgram(prog)))
+
+
+if __name__ == '__main__':
+    unittest.main()
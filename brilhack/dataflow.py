@@ -1,23 +1,22 @@
+from .analysis_manager import analysis, analysis_names, get_analysis
 from .basic_blocks import Function, BBProgram
-from .util import is_value_op
-from typing import Dict, List, Tuple
-import logging
+from .stream import ProgramStream
+from collections.abc import Mapping
+from typing import Dict, List, Set, Tuple
 import argparse
+import heapq
+import logging
 import json
 import sys
 
-ALL_ANALYSES = {}
-
-
-def analysis(name):
-    def decorator(func):
-        ALL_ANALYSES[name] = func
-        return func
-
-    return decorator
-
 
 class DataFlowAnalysis:
+    # Forward analyses compute the value at the end of each block from the
+    # values at the end of its predecessors. Backward analyses compute the
+    # value at the start of each block from the values at the start of its
+    # successors.
+    direction = 'forward'
+
     def initval(self):
         raise NotImplementedError("Impls must override initval().")
 
@@ -28,90 +27,358 @@ class DataFlowAnalysis:
         raise NotImplementedError("Impls must override merge().")
 
     def solve(self, func: Function):
-        """Solve a dataflow problem with the worklist algorithm."""
+        """Solve a dataflow problem with the worklist algorithm.
+
+        Returns the output of the transfer function for each block, i.e., the
+        value at the end (forward) or start (backward) of each block. After
+        solving, `self.invals` holds the corresponding inputs to the transfer
+        function, `self.iterations` the number of transfer function
+        applications it took, and `self.sweeps` the number of passes over the
+        processing order.
+
+        Blocks are taken off the worklist in reverse postorder for forward
+        analyses, and in postorder for backward ones, so that on reducible
+        CFGs most blocks are only processed after their inputs settled.
+        """
         num_blocks = len(func.blocks)
+        cfg = func.cfg
+        if self.direction == 'forward':
+            order = cfg.reverse_postorder()
+            sources, targets = cfg.preds, cfg.succs
+        elif self.direction == 'backward':
+            order = cfg.postorder()
+            sources, targets = cfg.succs, cfg.preds
+        else:
+            raise ValueError('Bad dataflow direction {}'.format(
+                self.direction))
 
-        # Map from block to predecessor index list.
-        preds = [[] for _ in range(num_blocks)]
-        for block, succs in enumerate(func.block_exits):
-            for succ in succs:
-                if succ < num_blocks:
-                    preds[succ].append(block)
+        # priority[b] = position of block b in the processing order.
+        priority = [0] * len(cfg)
+        for i, block_idx in enumerate(order):
+            priority[block_idx] = i
+        # Blocks to process in the current sweep over the order, as a heap of
+        # (priority, block). Blocks that need to be revisited but come at or
+        # before the current block in the order wait for the next sweep, so
+        # that a sweep is never restarted half way.
+        worklist = [(priority[b], b) for b in range(num_blocks)]
+        heapq.heapify(worklist)
+        next_sweep = []
+        in_worklist = bytearray([1]) * num_blocks
 
-        worklist = set(range(len(func.blocks)))
         invals = [self.initval(func) for _ in range(num_blocks)]
         outvals = [self.initval(func) for _ in range(num_blocks)]
-        while worklist:
-            block_idx = worklist.pop()
-            block = func.blocks[block_idx]
+        iterations = 0
+        sweeps = 0
+        while worklist or next_sweep:
+            if not worklist:
+                worklist, next_sweep = next_sweep, worklist
+                sweeps += 1
+            curr_priority, block_idx = heapq.heappop(worklist)
+            in_worklist[block_idx] = 0
+            iterations += 1
 
             # The input to the transfer func for a block is the merger of
             # its current input value and output values of all predecessor
-            # blocks.
-            predvals = [outvals[p] for p in preds[block_idx]]
-            predvals.append(invals[block_idx])
+            # (successor, for backward analyses) blocks.
+            sourcevals = [
+                outvals[b] for b in sources(block_idx) if b < num_blocks
+            ]
+            sourcevals.append(invals[block_idx])
 
-            invals[block_idx] = self.merge(predvals)
+            invals[block_idx] = self.merge(sourcevals)
             block_out = self.transfer(func, block_idx, invals[block_idx])
             if block_out != outvals[block_idx]:
                 outvals[block_idx] = block_out
-                for succ_idx in func.block_exits[block_idx]:
-                    if succ_idx < num_blocks:
-                        worklist.add(succ_idx)
+                for target in targets(block_idx):
+                    if target < num_blocks and not in_worklist[target]:
+                        in_worklist[target] = 1
+                        p = priority[target]
+                        heapq.heappush(
+                            worklist if p > curr_priority else next_sweep,
+                            (p, target))
 
+        logging.debug('Solved {} for {} in {} iterations ({} sweeps)'.format(
+            self.__class__.__name__, func.name, iterations, sweeps + 1))
+        self.invals = invals
+        self.iterations = iterations
+        self.sweeps = sweeps + 1
         return outvals
 
 
+class BitVectorAnalysis(DataFlowAnalysis):
+    """A dataflow analysis whose values are sets of small integers, stored as
+    Python int bitsets, with set union as the merge.
+
+    Impls override gen_kill(), which summarizes the effect of a block as the
+    bits it sets (gen) and clears (kill). transfer() then only does
+    `gen | (inval & ~kill)`.
+    """
+    def gen_kill(self, func, block_id) -> Tuple[int, int]:
+        raise NotImplementedError("Impls must override gen_kill().")
+
+    def initval(self, func) -> int:
+        return 0
+
+    def solve(self, func: Function):
+        self._gen_kill = [
+            self.gen_kill(func, block_id)
+            for block_id in range(len(func.blocks))
+        ]
+        return super().solve(func)
+
+    def transfer(self, func, block_id, inval) -> int:
+        gen, kill = self._gen_kill[block_id]
+        return gen | (inval & ~kill)
+
+    def merge(self, vals) -> int:
+        merged = 0
+        for val in vals:
+            merged |= val
+        return merged
+
+
+def iter_bits(bits: int):
+    """Yields the indices of the set bits of `bits`, in increasing order."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
 # Map from variable name to the set of (block_id, instr_id) of instructions
 # that define it. There can be multiple reaching definitions of the same var
 # at a given point in the program due to, e.g., conditional jumps in a CFG.
-ReachingDefsMap = dict[str, set[tuple[int, int]]]
-
-
-class ReachingDefinitions(DataFlowAnalysis):
-    def initval(self, func: Function) -> ReachingDefsMap:
-        # Definitions are maintained as a map {varname: (block_id, instr_id)}
-        # For function params, the value is (None, param_index), where param_index is
-        # the 0-based index of the param.
-        return {a["name"]: {(None, i)} for i, a in enumerate(func.args)}
-
-    def transfer(self, func, block_id, inval) -> ReachingDefsMap:
-        block = func.blocks[block_id]
-        outval = inval.copy()
-        for i, instr in enumerate(block):
-            if is_value_op(instr):
-                v = instr['dest']
-                if v in outval:
-                    logging.debug(
-                        'Previous definition of {} from {} killed at {}'.
-                        format(v, outval[v], (block_id, i)))
-                outval[v] = {(block_id, i)}
-        return outval
-
-    def merge(self, vals) -> ReachingDefsMap:
-        merged = {}
-        for val in vals:
-            for var, defs in val.items():
-                s = merged.setdefault(var, set())
-                for d in defs:
-                    s.add(d)
-        return merged
+ReachingDefsMap = Mapping[str, Set[Tuple[int, int]]]
+
+
+class ReachingDefsView(Mapping):
+    """A read-only ReachingDefsMap over a bitset of definitions of a solved
+    ReachingDefinitions. The sets of sites are only decoded on lookup, and
+    shared by all views on the same definitions: they must not be modified."""
+    __slots__ = ('_rd', '_names', '_bits')
+
+    def __init__(self, rd, func: Function, bits: int):
+        self._rd = rd
+        self._names = func.symbols
+        self._bits = bits
+
+    def __getitem__(self, name):
+        var = self._names.ids.get(name)
+        if var is None or var >= len(self._rd.var_defs):
+            raise KeyError(name)
+        defs = self._rd.decode(self._bits & self._rd.var_defs[var])
+        if not defs:
+            raise KeyError(name)
+        return defs
+
+    def __iter__(self):
+        names = self._names.names
+        bits = self._bits
+        for var, defs in enumerate(self._rd.var_defs):
+            if bits & defs:
+                yield names[var]
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def block_defs_summary(func: Function, block_id: int):
+    """Summarizes the definitions in a block as a tuple of (var_id, instr_id)
+    pairs for the last definition of each variable in it. All other
+    definitions of those variables are killed by the block."""
+    last = {}
+    for i, instr in enumerate(func.blocks[block_id]):
+        if instr.dest is not None:
+            func.symbols.ensure_bound(instr)
+            last[instr.dest_id] = i
+    return tuple(last.items())
+
+
+class ReachingDefinitions(BitVectorAnalysis):
+    """Reaching definitions, as bitsets over the numbered definitions of a
+    function.
+
+    Definitions are numbered by solve(): function params first, then the last
+    definition of each variable in each block (no other definition can reach
+    the end of a block). After solving, `sites[k]` is the (block_id, instr_id)
+    of definition k, or (None, param_index) for a function param, and
+    `def_vars[k]` is the id of the variable it defines.
+    """
+    def solve(self, func: Function):
+        symbols = func.symbols
+        self.sites = [(None, i) for i in range(len(func.args))]
+        self.def_vars = [symbols.intern(a['name']) for a in func.args]
+
+        block_defs = [
+            func.block_summary('reaching_defs', block_id, block_defs_summary)
+            for block_id in range(len(func.blocks))
+        ]
+        for block_id, summary in enumerate(block_defs):
+            for var, i in summary:
+                self.sites.append((block_id, i))
+                self.def_vars.append(var)
+
+        # var_defs[var] = bitset of all numbered definitions of var.
+        var_defs = self.var_defs = [0] * len(symbols)
+        for k, var in enumerate(self.def_vars):
+            var_defs[var] |= 1 << k
+        # Map from bitsets of definitions to their decoded sets of sites.
+        self._decoded = {}
+        self._block_gen_kill = []
+        k = len(func.args)
+        for summary in block_defs:
+            gen = kill = 0
+            for var, _ in summary:
+                gen |= 1 << k
+                kill |= var_defs[var]
+                k += 1
+            self._block_gen_kill.append((gen, kill))
+
+        self._params = (1 << len(func.args)) - 1
+        return super().solve(func)
+
+    def initval(self, func: Function) -> int:
+        # Function params are defined on entry to every block, so that they
+        # reach any use not preceded by another definition.
+        return self._params
+
+    def gen_kill(self, func, block_id) -> Tuple[int, int]:
+        return self._block_gen_kill[block_id]
+
+    def decode(self, bits: int) -> Set[Tuple[int, int]]:
+        """Returns the set of sites of the definitions in bitset `bits`. The
+        result is shared, and must not be modified."""
+        defs = self._decoded.get(bits)
+        if defs is None:
+            sites = self.sites
+            defs = self._decoded[bits] = frozenset(
+                sites[k] for k in iter_bits(bits))
+        return defs
+
+    def as_map(self, func: Function, bits: int) -> ReachingDefsMap:
+        """Returns the ReachingDefsMap for the bitset `bits`, decoded lazily
+        (see ReachingDefsView)."""
+        return ReachingDefsView(self, func, bits)
+
+
+def block_uses_summary(func: Function, block_id: int) -> Tuple[int, int]:
+    """Summarizes a block as (uses, defs) bitsets over variable ids: the
+    variables it reads before writing them, and those it writes."""
+    uses = defs = 0
+    ensure_bound = func.symbols.ensure_bound
+    for instr in func.blocks[block_id]:
+        ensure_bound(instr)
+        if instr.arg_ids:
+            for arg in instr.arg_ids:
+                if not defs >> arg & 1:
+                    uses |= 1 << arg
+        if instr.dest_id is not None:
+            defs |= 1 << instr.dest_id
+    return uses, defs
+
+
+class LiveVariables(BitVectorAnalysis):
+    """Live variables, as bitsets over variable ids.
+
+    A backward analysis: solve() returns the variables live on entry to each
+    block, and `invals` holds those live on exit.
+    """
+    direction = 'backward'
+
+    def gen_kill(self, func, block_id) -> Tuple[int, int]:
+        return func.block_summary('live_vars', block_id, block_uses_summary)
+
+
+class Liveness:
+    """The live variables of a function, as bitsets over variable ids.
+
+    Per-block values are solved up front; per-instruction values are computed
+    for a whole block the first time one of its instructions is queried.
+    """
+    def __init__(self, func: Function):
+        self.func = func
+        analysis = LiveVariables()
+        self._live_in = analysis.solve(func)
+        self._live_out = analysis.invals
+        # _live_after[block_id][instr_id] = variables live after the instr.
+        self._live_after = {}
+
+    def live_in(self, block_id: int) -> int:
+        """Returns the variables live on entry to block `block_id`. Nothing is
+        live in the dummy exit node, if block_id is that."""
+        if block_id >= len(self._live_in):
+            return 0
+        return self._live_in[block_id]
+
+    def live_out(self, block_id: int) -> int:
+        return self._live_out[block_id]
+
+    def live_after(self, block_id: int, instr_id: int) -> int:
+        """Returns the variables live just after instruction `instr_id` of
+        block `block_id`."""
+        live_after = self._live_after.get(block_id)
+        if live_after is None:
+            block = self.func.blocks[block_id]
+            live_after = [0] * len(block)
+            live = self._live_out[block_id]
+            for i in range(len(block) - 1, -1, -1):
+                live_after[i] = live
+                instr = block[i]
+                if instr.dest_id is not None:
+                    live &= ~(1 << instr.dest_id)
+                if instr.arg_ids:
+                    for arg in instr.arg_ids:
+                        live |= 1 << arg
+            self._live_after[block_id] = live_after
+        return live_after[instr_id]
+
+    def is_live_in(self, block_id: int, var_id: int) -> bool:
+        return self.live_in(block_id) >> var_id & 1 == 1
+
+    def is_live_out(self, block_id: int, var_id: int) -> bool:
+        return self._live_out[block_id] >> var_id & 1 == 1
+
+    def names(self, bits: int) -> Set[str]:
+        """Returns the names of the variables in bitset `bits`."""
+        names = self.func.symbols.names
+        return {names[var] for var in iter_bits(bits)}
+
+    def __repr__(self):
+        return '\n'.join(
+            'block {}: in {} out {}'.format(i, sorted(self.names(live_in)),
+                                            sorted(self.names(live_out)))
+            for i, (live_in,
+                    live_out) in enumerate(zip(self._live_in, self._live_out)))
+
+
+@analysis("live_vars")
+def live_vars(func) -> Liveness:
+    return Liveness(func)
 
 
 @analysis("reaching_defs")
 def reaching_defs(func) -> list[ReachingDefsMap]:
-    """Returns the map of reaching variable defs at the end of each block."""
-    return ReachingDefinitions().solve(func)
+    """Returns the map of reaching variable defs at the end of each block, see
+    ReachingDefinitions.as_map()."""
+    rd = ReachingDefinitions()
+    return [rd.as_map(func, bits) for bits in rd.solve(func)]
 
 
 def main(args):
-    afunc = ALL_ANALYSES[args.analysis]
-    if args.input is None:
-        prog = json.load(sys.stdin)
-        bbprog = BBProgram(prog)
-        for name, func in bbprog.funcs.items():
+    afunc = get_analysis(args.analysis)
+    infile = sys.stdin if args.input is None else open(args.input)
+    with infile:
+        if args.stream:
+            funcs = (Function.from_bril(func)
+                     for func in ProgramStream(infile).functions())
+        else:
+            funcs = BBProgram(json.load(infile)).funcs.values()
+        for func in funcs:
             result = afunc(func)
-            print('Function {}\n----------\n{}\n'.format(result))
+            print('Function {}\n----------\n{}\n'.format(func.name, result))
 
 
 if __name__ == '__main__':
@@ -122,6 +389,11 @@ if __name__ == '__main__':
         help="Input bril (JSON) program file. If not given, read from STDIN.")
     parser.add_argument('--analysis',
                         help="Name of the analysis to run, one of: {}".format(
-                            ", ".join(sorted(ALL_ANALYSES.keys()))))
+                            ", ".join(analysis_names())))
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help="Read and analyze one function at a time, so that memory use is "
+        "bounded by the largest function.")
     args = parser.parse_args()
     main(args)
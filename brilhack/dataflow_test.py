@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 from pprint import pprint
 
 from . import dataflow
@@ -64,6 +65,26 @@ class DataFlowTest(unittest.TestCase):
             },
         ])
 
+    def test_reaching_defs_are_decoded_lazily(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(x: int) {
+            v: int = const 0;
+            .loop:
+            print v;
+            br x .loop .end;
+            .end:
+            print v;
+          }"""))
+        defs = dataflow.reaching_defs(bbprog.funcs["main"])
+        self.assertIsInstance(defs[1], dataflow.ReachingDefsView)
+        self.assertEqual(sorted(defs[1]), ["v", "x"])
+        self.assertEqual(len(defs[1]), 2)
+        self.assertNotIn("y", defs[1])
+        # Equal sets of definitions are decoded once, and shared.
+        self.assertIs(defs[0]["v"], defs[2]["v"])
+        self.assertEqual(repr(defs[0]), "{'x': frozenset({(None, 0)}), "
+                         "'v': frozenset({(0, 0)})}")
+
     def test_reaching_defs(self):
         bbprog = BBProgram(prog=parser.parse("""
           @main() {
@@ -93,6 +114,157 @@ class DataFlowTest(unittest.TestCase):
                 }
             ])
 
+    def test_reaching_defs_kills_params_and_earlier_defs(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(x: int, y: int) {
+            v: int = const 1;
+            v: int = add v x;
+            br y .redefine .end;
+            .redefine:
+            x: int = const 2;
+            v: int = id x;
+            .end:
+          }"""))
+        defs = dataflow.reaching_defs(bbprog.funcs["main"])
+        self.assertEqual(defs, [
+            {
+                "x": {(None, 0)},
+                "y": {(None, 1)},
+                "v": {(0, 1)}
+            },
+            {
+                "x": {(1, 1)},
+                "y": {(None, 1)},
+                "v": {(1, 2)}
+            },
+            {
+                "x": {(None, 0), (1, 1)},
+                "y": {(None, 1)},
+                "v": {(0, 1), (1, 2)}
+            },
+        ])
+
+    def test_solver_iterations(self):
+        """Three nested loops, with the reaching definitions of the innermost
+        body flowing out to the outer loops. Processing blocks in reverse
+        postorder, the first sweep visits every block once, and propagates
+        the def in .l3 out of all loops. The second sweep carries it around
+        the back edges into .l1, .l2 and .l3, where it changes nothing more."""
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(x: int) {
+            a: int = const 0;
+            .l1:
+            .l2:
+            .l3:
+            a: int = add a x;
+            br x .l3 .l2end;
+            .l2end:
+            br x .l2 .l1end;
+            .l1end:
+            br x .l1 .end;
+            .end:
+            print a;
+          }"""))
+        main = bbprog.funcs["main"]
+        rd = dataflow.ReachingDefinitions()
+        rd.solve(main)
+        self.assertEqual(rd.sweeps, 2)
+        self.assertEqual(rd.iterations, len(main.blocks) + 3)
+
+    def test_backward_analysis(self):
+        class UsedLater(dataflow.DataFlowAnalysis):
+            """Names of variables used at or after each point."""
+            direction = 'backward'
+
+            def initval(self, func):
+                return frozenset()
+
+            def transfer(self, func, block_id, inval):
+                used = set(inval)
+                for instr in func.blocks[block_id]:
+                    used.update(instr.get('args', []))
+                return frozenset(used)
+
+            def merge(self, vals):
+                return frozenset().union(*vals)
+
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(x: int, y: int) {
+            br x .a .b;
+            .a:
+            print y;
+            jmp .a;
+            .b:
+            print x;
+          }"""))
+        analysis = UsedLater()
+        used_at_start = analysis.solve(bbprog.funcs["main"])
+        self.assertEqual(used_at_start, [{"x", "y"}, {"y"}, {"x"}])
+        # Values at the end of each block.
+        self.assertEqual(analysis.invals, [{"x", "y"}, {"y"}, set()])
+
+    def test_live_variables(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(x: int, y: int) {
+            z: int = add x x;
+            br x .a .b;
+            .a:
+            y: int = id z;
+            print y;
+            jmp .a;
+            .b:
+            print y;
+          }"""))
+        main = bbprog.funcs["main"]
+        x, y, z = (main.symbols.ids[name] for name in "xyz")
+        live = dataflow.LiveVariables()
+        live_in = live.solve(main)
+        self.assertEqual(live_in,
+                         [1 << x | 1 << y, 1 << z, 1 << y])
+        self.assertEqual(live.invals, [1 << y | 1 << z, 1 << z, 0])
+
+        liveness = main.analyses.get("live_vars")
+        self.assertIs(main.analyses.get("live_vars"), liveness)
+        self.assertEqual(liveness.names(liveness.live_in(0)), {"x", "y"})
+        self.assertEqual(liveness.names(liveness.live_out(0)), {"y", "z"})
+        self.assertTrue(liveness.is_live_in(1, z))
+        self.assertFalse(liveness.is_live_out(2, y))
+        # Nothing is live in the dummy exit node.
+        self.assertEqual(liveness.live_in(3), 0)
+        self.assertEqual(
+            [liveness.names(liveness.live_after(1, i)) for i in range(4)],
+            [{"z"}, {"y", "z"}, {"z"}, {"z"}])
+
+    def test_reaching_defs_summaries_are_cached(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(x: int) {
+            v: int = const 1;
+            v: int = add v x;
+            w: int = id v;
+            br x .end .end;
+            .end:
+            print v;
+          }"""))
+        main = bbprog.funcs["main"]
+        dataflow.reaching_defs(main)
+        with mock.patch.object(dataflow,
+                               'block_defs_summary') as block_defs_summary:
+            self.assertEqual(dataflow.reaching_defs(main)[1], {
+                "x": {(None, 0)},
+                "v": {(0, 1)},
+                "w": {(0, 2)}
+            })
+            block_defs_summary.assert_not_called()
+        self.assertEqual(
+            main.block_summary('reaching_defs', 0,
+                               dataflow.block_defs_summary),
+            ((main.symbols.ids['v'], 1), (main.symbols.ids['w'], 2)))
+
+    def test_iter_bits(self):
+        self.assertEqual(list(dataflow.iter_bits(0)), [])
+        self.assertEqual(list(dataflow.iter_bits(0b101001)), [0, 3, 5])
+        self.assertEqual(list(dataflow.iter_bits(1 << 200)), [200])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,86 +1,119 @@
 # There are two varieties of simple DCE to be performed:
-# 1. Find value ops whose destinations are not used in effect operations and
-#    delete them. This can be done globally (function level).
-# 2. Find redundant variable assignments within a block and delete them. This
-#    cannot be done as easily globally because of missing runtime control flow
-#    information.
+# 1. Find value ops whose destinations are not used in effect operations,
+#    directly or through other value ops, and delete them. This can be done
+#    globally (function level), with the def-use chains from reaching defs.
+# 2. Find assignments within a block whose variable is dead after them, given
+#    the variables live at the end of the block, and delete them.
 import logging
 from . import basic_blocks
-from .util import is_value_op
+from .analysis_manager import CFG_ANALYSES, transform
+from .util import is_effect_op
 
 
 def _global_dce(func: basic_blocks.Function) -> basic_blocks.Function:
-    optfunc = basic_blocks.Function.filter_copy(func)
+    """Removes the value ops that no effect op depends on.
 
-    # Perform multiple rounds of removal until there is no removal possible.
-    while True:
-        candidates = {}
+    Marks the effect ops live, then every def reaching an arg of a live
+    instruction, using the def-use index of `func`. All value ops left unmarked
+    are removed in a single copy of the function.
+    """
+    index = func.analyses.get('def_use')
+    live = set()
+    worklist = []
+    for block_idx, block in enumerate(func.blocks):
+        for instr_idx, instr in enumerate(block):
+            if is_effect_op(instr):
+                live.add((block_idx, instr_idx))
+                worklist.append((block_idx, instr_idx))
+    while worklist:
+        for def_site in index.defs(worklist.pop()):
+            # Function params (block_idx None) are never removed.
+            if def_site[0] is not None and def_site not in live:
+                live.add(def_site)
+                worklist.append(def_site)
 
-        # Set of variable names that are used in the RHS of any op. Once seen
-        # as used, this var may not be candidate for removal in this round.
-        used = set()
-        for block_idx, block in enumerate(optfunc.blocks):
-            for instr_idx, instr in enumerate(block):
-                for arg in instr.get('args', []):
-                    used.add(arg)
-                    candidates.pop(arg, None)
-                if is_value_op(instr) and instr['dest'] not in used:
-                    candidates[instr['dest']] = (block_idx, instr_idx)
-        if not candidates:
-            # This means there were no more opportunities, i.e., the optimization
-            # has converged.
-            return optfunc
-        logging.debug('global dce: removing {} from function {}'.format(
-            candidates, optfunc.name))
-        optfunc = basic_blocks.Function.filter_copy(optfunc,
-                                                    exclude=set(
-                                                        candidates.values()))
+    dead = {(block_idx, instr_idx)
+            for block_idx, block in enumerate(func.blocks)
+            for instr_idx in range(len(block))
+            if (block_idx, instr_idx) not in live}
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug('global dce: removing %s from function %s',
+                      sorted(dead), func.name)
+    return basic_blocks.Function.filter_copy(func, exclude=dead)
 
 
-def _local_dce(block):
-    optblock = block[:]
-    while True:
-        remove = set()
-        candidates = {}
-        for idx, instr in enumerate(optblock):
-            for arg in instr.get('args', []):
-                candidates.pop(arg, None)
-            if is_value_op(instr):
-                dst = instr['dest']
-                # The previous assignment of this dst has been unused, and we
-                # are at another assignment. Hence the existing assignment can
-                # be removed.
-                if dst in candidates:
-                    remove.add(candidates[dst])
-                candidates[dst] = idx
-        if not remove:
-            return optblock
-        remove_vars = [block[idx] for idx in sorted(remove)]
-        logging.debug('local dce: removing {} from block {}'.format(
-            remove_vars, idx))
-        optblock = [b for i, b in enumerate(optblock) if i not in remove]
+def _local_dce(block, live_out: int, symbols: basic_blocks.SymbolTable):
+    """Returns `block` without the value ops whose dest is dead, given the
+    bitset `live_out` of variable ids in `symbols` live at the end of the
+    block.
+
+    Walks the block backwards once, keeping track of the live variables.
+    """
+    live = live_out
+    optblock = []
+    removed = []
+    for instr in reversed(block):
+        symbols.ensure_bound(instr)
+        dest = instr.dest_id
+        if dest is not None:
+            if not live >> dest & 1:
+                removed.append(instr)
+                continue
+            live &= ~(1 << dest)
+        if instr.arg_ids:
+            for arg in instr.arg_ids:
+                live |= 1 << arg
+        optblock.append(instr)
+    if removed:
+        logging.debug('local dce: removing %s', removed)
+    optblock.reverse()
     return optblock
 
 
+# Removing instructions leaves the blocks, and so the CFG, as they are.
+@transform(preserves=CFG_ANALYSES)
 def _process_func(func: basic_blocks.Function) -> basic_blocks.Function:
     optfunc = _global_dce(func)
-    for i in range(len(optfunc.blocks)):
-        optfunc.blocks[i] = _local_dce(optfunc.blocks[i])
+    liveness = optfunc.analyses.get('live_vars')
+    for i, block in enumerate(optfunc.blocks):
+        optblock = _local_dce(block, liveness.live_out(i), optfunc.symbols)
+        if len(optblock) != len(block):
+            optfunc.set_block(i, optblock)
     return optfunc
 
 
-def dead_code_elimination(
-        bbprog: basic_blocks.BBProgram) -> basic_blocks.BBProgram:
+def dead_code_elimination(bbprog: basic_blocks.BBProgram,
+                          func_names=None) -> basic_blocks.BBProgram:
+    """Returns `bbprog` with dead code removed from the functions named in
+    `func_names` (default: all functions). Other functions are passed through
+    as is, and never built if `bbprog` is lazy."""
     optprog = basic_blocks.BBProgram()
-    for name, func in bbprog.funcs.items():
-        optprog.funcs[name] = _process_func(func)
+    for name in bbprog.funcs:
+        if func_names is None or name in func_names:
+            optprog.funcs[name] = _process_func(bbprog.funcs[name])
+        else:
+            optprog.funcs.set_bril(name, bbprog.funcs.bril(name))
     return optprog
 
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
-    import json, sys
-    prog = json.load(sys.stdin)
-    bbprog = basic_blocks.BBProgram(prog)
-    optprog = dead_code_elimination(bbprog)
-    json.dump(optprog.bril_dict(), sys.stdout)
+    import argparse, json, sys
+    from .stream import transform_functions
+    parser = argparse.ArgumentParser(
+        description='Eliminate dead code in a bril (JSON) program on STDIN')
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Read, optimize and write out one function at a time, so that '
+        'memory use is bounded by the largest function.')
+    args = parser.parse_args()
+    if args.stream:
+        transform_functions(
+            sys.stdin, sys.stdout, lambda func: _process_func(
+                basic_blocks.Function.from_bril(func)).to_bril())
+    else:
+        prog = json.load(sys.stdin)
+        bbprog = basic_blocks.BBProgram(prog)
+        optprog = dead_code_elimination(bbprog)
+        json.dump(optprog.bril_dict(), sys.stdout)
@@ -1,6 +1,8 @@
 import unittest
 from .basic_blocks import BBProgram
+from . import dataflow
 from . import dead_code_elimination as dce
+from .instr import Instr
 from . import parser
 
 
@@ -141,6 +143,167 @@ class DeadCodeEliminationTest(unittest.TestCase):
             }],
         ])
 
+    def test_global_dce_removes_long_dead_chains(self):
+        """A chain v1 = 1, v2 = v1 + v1, ... is removed entirely when its last
+        variable is unused, but kept when it is printed."""
+        n = 5000
+        chain = '\n'.join('v{}: int = add v{} v{};'.format(k, k - 1, k - 1)
+                          for k in range(2, n + 1))
+        for printed, expected_len in (('v0', 2), ('v{}'.format(n), n + 1)):
+            bbprog = BBProgram(prog=parser.parse("""
+              @main {
+                v0: int = const 0;
+                v1: int = const 1;
+                %s
+                print %s;
+              }""" % (chain, printed)))
+            optprog = dce.dead_code_elimination(bbprog)
+            self.assertEqual(len(optprog.funcs['main'].blocks[0]),
+                             expected_len)
+
+    def test_global_dce_follows_reaching_defs(self):
+        """Defs that no use is reached by are removed across blocks, while
+        the defs reaching a use from different paths are kept:
+
+            @main(c: bool) {
+              x: int = const 1;
+              br c .a .b;
+              .a:
+              x: int = const 2;
+              jmp .end;
+              .b:
+              x: int = const 3;
+              .end:
+              print x;
+            }
+        """
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(c: bool) {
+            x: int = const 1;
+            br c .a .b;
+            .a:
+            x: int = const 2;
+            jmp .end;
+            .b:
+            x: int = const 3;
+            .end:
+            print x;
+          }"""))
+        optprog = dce.dead_code_elimination(bbprog)
+        self.assertEqual(
+            [[instr.get('value') for instr in block]
+             for block in optprog.funcs['main'].blocks],
+            [[None], [None, 2, None], [None, 3], [None, None]])
+
+    def test_global_dce_sees_instrs_edited_in_place(self):
+        main = BBProgram(prog=parser.parse("""
+          @main {
+            a: int = const 1;
+            b: int = const 2;
+            c: int = add a a;
+            print c;
+          }""")).funcs['main']
+        block = main.mutable_block(0)
+        block[2]['args'] = ['b', 'b']
+        block.insert(3, Instr.from_bril({'op': 'print', 'args': ['a']}))
+        self.assertEqual(
+            dce._global_dce(main).blocks,
+            BBProgram(prog=parser.parse("""
+          @main {
+            a: int = const 1;
+            b: int = const 2;
+            c: int = add b b;
+            print a;
+            print c;
+          }""")).funcs['main'].blocks)
+
+    def test_local_dce_uses_liveness_at_block_exit(self):
+        """Walking the first block backwards from the variables live at its
+        end, `b: int = const 2` is dead since .next overwrites b before any
+        use, and `a: int = const 1` is dead since it is overwritten later in
+        the block:
+
+            @main {
+              a: int = const 1;
+              b: int = const 2;
+              a: int = const 3;
+              print a;
+              .next:
+              b: int = const 4;
+              print b;
+            }
+        """
+        bbprog = BBProgram(prog=parser.parse("""
+          @main {
+            a: int = const 1;
+            b: int = const 2;
+            a: int = const 3;
+            print a;
+            .next:
+            b: int = const 4;
+            print b;
+          }"""))
+        main = bbprog.funcs['main']
+        live = dataflow.LiveVariables()
+        live.solve(main)
+        self.assertEqual(live.invals[0], 0)
+        self.assertEqual(dce._local_dce(main.blocks[0], live.invals[0],
+                                       main.symbols), [{
+            "dest": "a",
+            "op": "const",
+            "type": "int",
+            "value": 3
+        }, {
+            "args": ["a"],
+            "op": "print"
+        }])
+
+    def test_local_dce_binds_instrs_added_in_place(self):
+        main = BBProgram(prog=parser.parse("""
+          @main {
+            a: int = const 1;
+            print a;
+          }""")).funcs['main']
+        block = main.mutable_block(0)
+        block.append(Instr.from_bril({
+            'op': 'const',
+            'dest': 'a',
+            'type': 'int',
+            'value': 2
+        }))
+        block.insert(1, Instr.from_bril({'op': 'print', 'args': ['a']}))
+        self.assertEqual(dce._local_dce(block, 0, main.symbols), block[:3])
+
+    def test_dce_only_builds_named_functions(self):
+        prog = parser.parse("""
+          @main {
+            a: int = const 1;
+            b: int = const 2;
+            print b;
+          }
+          @other {
+            a: int = const 1;
+            b: int = const 2;
+            print b;
+          }""")
+        bbprog = BBProgram(prog=prog, lazy=True)
+        optprog = dce.dead_code_elimination(bbprog, func_names={'main'})
+        self.assertFalse(bbprog.funcs.is_materialized('other'))
+        self.assertEqual(optprog.bril_dict()['functions'], [{
+            'name':
+            'main',
+            'args': [],
+            'instrs': [{
+                'dest': 'b',
+                'op': 'const',
+                'type': 'int',
+                'value': 2
+            }, {
+                'args': ['b'],
+                'op': 'print'
+            }]
+        }, prog['functions'][1]])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,67 @@
+"""Def-use and use-def chains, computed from reaching definitions.
+
+Sites are (block_id, instr_id) pairs, or (None, param_index) for function
+params, as in dataflow.ReachingDefsMap. They refer to the positions of
+instructions when the index was built, so passes that remove instructions
+query the index first, and rebuild the function once at the end (see
+basic_blocks.Function.filter_copy).
+"""
+from typing import Set, Tuple
+
+from .analysis_manager import analysis
+from .basic_blocks import Function
+from .dataflow import ReachingDefinitions
+
+Site = Tuple[int, int]
+
+
+class DefUseIndex:
+    def __init__(self, func: Function):
+        rd = ReachingDefinitions()
+        rd.solve(func)
+        # uses[def_site] = set of sites of instrs using the def.
+        self._uses = {site: set() for site in rd.sites}
+        # defs[use_site] = set of sites of defs reaching the use.
+        self._defs = {}
+        uses, defs = self._uses, self._defs
+        var_defs = rd.var_defs
+        for block_id, block in enumerate(func.blocks):
+            inval = rd.invals[block_id]
+            # Map from var id to the sites of the defs of it reaching the
+            # current instruction. Defs reaching the block are only decoded
+            # for the vars it uses.
+            reaching = {}
+            for instr_id, instr in enumerate(block):
+                site = (block_id, instr_id)
+                func.symbols.ensure_bound(instr)
+                if instr.arg_ids:
+                    use_defs = defs[site] = set()
+                    for arg in instr.arg_ids:
+                        arg_defs = reaching.get(arg)
+                        if arg_defs is None:
+                            # Vars interned after solving have no defs.
+                            arg_defs = ()
+                            if arg < len(var_defs):
+                                arg_defs = rd.decode(inval & var_defs[arg])
+                            reaching[arg] = arg_defs
+                        for def_site in arg_defs:
+                            use_defs.add(def_site)
+                            uses.setdefault(def_site, set()).add(site)
+                if instr.dest_id is not None:
+                    reaching[instr.dest_id] = [site]
+                    uses.setdefault(site, set())
+
+    def uses(self, def_site: Site) -> Set[Site]:
+        """Returns the sites of all instrs using the def at `def_site`. The
+        result must not be modified."""
+        return self._uses.get(def_site, frozenset())
+
+    def defs(self, use_site: Site) -> Set[Site]:
+        """Returns the sites of all defs reaching the args of the instr at
+        `use_site`. The result must not be modified."""
+        return self._defs.get(use_site, frozenset())
+
+
+@analysis('def_use')
+def def_use(func: Function) -> DefUseIndex:
+    return DefUseIndex(func)
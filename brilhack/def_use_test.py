@@ -0,0 +1,55 @@
+import unittest
+
+from .basic_blocks import BBProgram
+from .instr import Instr
+from .def_use import DefUseIndex
+from . import parser
+
+
+class DefUseIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.main = BBProgram(prog=parser.parse("""
+          @main(n: int) {
+            i: int = const 0;
+            .loop:
+            one: int = const 1;
+            i: int = add i one;
+            c: bool = lt i n;
+            br c .loop .done;
+            .done:
+            print i;
+            i: int = const 7;
+          }""")).funcs['main']
+
+    def test_chains(self):
+        index = DefUseIndex(self.main)
+        # Uses of the param n, and of the first def of i.
+        self.assertEqual(index.uses((None, 0)), {(1, 3)})
+        self.assertEqual(index.uses((0, 0)), {(1, 2)})
+        # i = add i one is reached by both defs of i before it.
+        self.assertEqual(index.defs((1, 2)), {(0, 0), (1, 2), (1, 1)})
+        self.assertEqual(index.uses((1, 2)), {(1, 2), (1, 3), (2, 1)})
+        self.assertEqual(index.defs((2, 1)), {(1, 2)})
+        # The last def of i is dead.
+        self.assertEqual(index.uses((2, 2)), set())
+        self.assertEqual(index.defs((2, 2)), frozenset())
+
+    def test_instrs_edited_in_place(self):
+        block = self.main.mutable_block(2)
+        block[1]['args'] = ['n']
+        block.insert(2, Instr.from_bril({'op': 'print', 'args': ['i']}))
+        index = DefUseIndex(self.main)
+        self.assertEqual(index.defs((2, 1)), {(None, 0)})
+        self.assertEqual(index.uses((None, 0)), {(1, 3), (2, 1)})
+        self.assertEqual(index.defs((2, 2)), {(1, 2)})
+        self.assertEqual(index.uses((1, 2)), {(1, 2), (1, 3), (2, 2)})
+
+    def test_is_cached_analysis(self):
+        index = self.main.analyses.get('def_use')
+        self.assertIs(self.main.analyses.get('def_use'), index)
+        self.main.mutable_block(2)
+        self.assertIsNot(self.main.analyses.get('def_use'), index)
+
+
+if __name__ == '__main__':
+    unittest.main()
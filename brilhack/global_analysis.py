@@ -1,34 +1,24 @@
+from array import array
 from typing import List, Set, Dict, Tuple
 from functools import reduce
 import logging
-from collections import deque
 
+from .analysis_manager import analysis, transform
 from .basic_blocks import Function
+from .cfg import CFG
 from .util import is_value_op, mklabel, mkjmp, is_terminator, instr_as_string
 from .util import can_have_side_effects
-from .dataflow import ReachingDefsMap, reaching_defs
+from .dataflow import Liveness
+from .def_use import DefUseIndex
 
 
 def postorder_blocks(cfg: List[List[int]]) -> List[int]:
     """Returns a post-ordering of `cfg`'s indices."""
-    visited = set()
-    acc = []
-
-    def _dfs(idx):
-        if idx not in visited:
-            visited.add(idx)
-            for succ in cfg[idx]:
-                _dfs(succ)
-            acc.append(idx)
-
-    for i in range(len(cfg)):
-        _dfs(i)
-
-    return acc
+    return list(CFG.of(cfg).postorder())
 
 
 def topological_sort(cfg: List[List[int]]) -> List[int]:
-    return reversed(postorder_blocks(cfg))
+    return list(CFG.of(cfg).reverse_postorder())
 
 
 def intersect(sets):
@@ -43,166 +33,370 @@ def intersect(sets):
 
 def predecessor_map(cfg: List[List[int]]) -> List[List[int]]:
     """Returns a parallel list mapping each node to a list of its preds."""
-    preds = [[] for _ in range(len(cfg))]
-    for i in range(len(cfg)):
-        for succ in cfg[i]:
-            preds[succ].append(i)
-    return preds
+    return CFG.of(cfg).pred_lists()
+
+
+def immediate_dominators(cfg: List[List[int]]) -> array:
+    """Returns idom, where idom[i] is the immediate dominator of node i of
+    `cfg`, or -1 if i is the entry node 0, or is unreachable from it.
+
+    Uses the iterative algorithm of Cooper, Harvey and Kennedy ("A Simple, Fast
+    Dominance Algorithm"), which walks the dominator tree built so far instead
+    of materializing dominator sets. It takes linear memory, and converges in a
+    few sweeps over the CFG in reverse postorder.
+    """
+    cfg = CFG.of(cfg)
+    n = len(cfg)
+    idom = [-1] * n
+    if not n:
+        return array('i')
+
+    # cfg.dfs() starts at node 0, so the nodes reachable from it come first in
+    # the postorder, ending with node 0 itself.
+    dfs = cfg.dfs()
+    postnum = dfs.post_num
+    rpo = dfs.postorder[postnum[0] - 1::-1]
+    pred_start, pred = cfg.pred_start, cfg.pred
+
+    idom[0] = 0
+    changed = True
+    while changed:
+        changed = False
+        for node in rpo:
+            new_idom = -1
+            for i in range(pred_start[node], pred_start[node + 1]):
+                p = pred[i]
+                # Skip unreachable preds, and those not processed yet.
+                if idom[p] == -1:
+                    continue
+                if new_idom == -1:
+                    new_idom = p
+                    continue
+                # Walk up from both nodes to their nearest common dominator.
+                while p != new_idom:
+                    while postnum[p] < postnum[new_idom]:
+                        p = idom[p]
+                    while postnum[new_idom] < postnum[p]:
+                        new_idom = idom[new_idom]
+            if idom[node] != new_idom:
+                idom[node] = new_idom
+                changed = True
+    idom[0] = -1
+    return array('i', idom)
+
+
+def dominator_sets(idom) -> List[Set[int]]:
+    """Returns the dominators of each node, given the immediate dominators
+    `idom` of a CFG. Nodes unreachable from the entry are dominated by all
+    nodes."""
+    n = len(idom)
+    dom = [None] * n
+    if n:
+        dom[0] = {0}
+
+    def _doms(node):
+        # Iterative, since the dominator tree can be deep.
+        path = []
+        while dom[node] is None:
+            path.append(node)
+            node = idom[node]
+        for child in reversed(path):
+            dom[child] = dom[node] | {child}
+            node = child
+
+    for i in range(n):
+        if dom[i] is None:
+            if idom[i] == -1:
+                dom[i] = set(range(n))
+            else:
+                _doms(i)
+    return dom
 
 
 def dominators(cfg: List[List[int]]) -> List[Set[int]]:
     """Returns the dominators for cfg as a parallel list."""
-    blocks = list(topological_sort(cfg))
-    nblock = len(blocks)
-    allblocks = set(range(nblock))
-    dom = [allblocks.copy() if i != 0 else {0} for i in range(nblock)]
-    more = True
-    preds = predecessor_map(cfg)
-    niter = 0
-    while more:
-        more = False
-        niter += 1
-        for i in range(nblock):
-            if not preds[i]:
-                continue
-            d = intersect([dom[p] for p in preds[i]])
-            d.add(i)
-            if d != dom[i]:
-                dom[i] = d
-                more = True
-    return dom
+    return dominator_sets(immediate_dominators(cfg))
 
 
 def dominator_tree(cfg: List[List[int]]) -> List[Set[int]]:
     """Returns the dominator tree for cfg as a parallel list."""
-    preds = predecessor_map(cfg)
-    all_doms = dominators(cfg)
-    domtree = [set() for _ in range(len(cfg))]
-    for idx, doms in enumerate(all_doms):
-        # Domtree parent is the predecessor which is a dominator.
-        # Note that we cannot have all predecessors dominating a node.
-        parent = doms.intersection(preds[idx])
-        assert len(
-            parent
-        ) <= 1, 'For node {}, multiple domination tree parent candidates ({}) found! doms={}, preds={}'.format(
-            idx, parent, doms, preds[idx])
-        if parent:
-            domtree[parent.pop()].add(idx)
+    idom = immediate_dominators(cfg)
+    domtree = [set() for _ in range(len(idom))]
+    for node, parent in enumerate(idom):
+        if parent != -1:
+            domtree[parent].add(node)
     return domtree
 
 
+class DominanceQuery:
+    """Answers dominance queries in constant time, with linear memory.
+
+    Numbers the nodes of the dominator tree in DFS preorder and postorder, so
+    that a dominates b iff the [pre, post] interval of a contains that of b.
+    Like dominators(), nodes unreachable from the entry are considered
+    dominated by every node.
+    """
+    def __init__(self, idom):
+        n = len(idom)
+        self.idom = idom
+        children = [[] for _ in range(n)]
+        for node, parent in enumerate(idom):
+            if parent != -1:
+                children[parent].append(node)
+        # -1 for unreachable nodes.
+        self.pre = array('i', [-1]) * n
+        self.post = array('i', [-1]) * n
+        self.depth = array('i', bytes(4 * n))
+        if not n:
+            return
+        counter = 0
+        self.pre[0] = counter
+        stack = [(0, iter(children[0]))]
+        while stack:
+            node, it = stack[-1]
+            child = next(it, None)
+            if child is not None:
+                counter += 1
+                self.pre[child] = counter
+                self.depth[child] = self.depth[node] + 1
+                stack.append((child, iter(children[child])))
+            else:
+                stack.pop()
+                self.post[node] = counter
+
+    def dominates(self, a: int, b: int) -> bool:
+        pre, post = self.pre, self.post
+        if pre[b] == -1:
+            return True
+        return pre[a] <= pre[b] and post[b] <= post[a] and pre[a] != -1
+
+    def strictly_dominates(self, a: int, b: int) -> bool:
+        return a != b and self.dominates(a, b)
+
+    def nearest_common_dominator(self, a: int, b: int) -> int:
+        """Returns the node closest to a and b that dominates both, or -1 if
+        there is none (a and b are distinct and unreachable)."""
+        if self.pre[a] == -1:
+            return b if self.pre[b] != -1 or a == b else -1
+        if self.pre[b] == -1:
+            return a
+        idom, depth = self.idom, self.depth
+        while depth[a] > depth[b]:
+            a = idom[a]
+        while depth[b] > depth[a]:
+            b = idom[b]
+        while a != b:
+            a, b = idom[a], idom[b]
+        return a
+
+
 class NotANaturalLoop(Exception):
     pass
 
 
-def _extract_loop(cfg: List[List[int]], doms, preds, header, loopback):
-    """Given the header and a loopback node that there is a loopback->header
-  back-edge in `cfg`, returns the minimal set of nodes in `cfg` L such that
-
-    1. loopback and header are in L.
-    2. If a given node n is in L, and n != header, preds(n) are all also in L.
-  """
-    if header not in doms[loopback]:
-        raise NotANaturalLoop('{} is not dominated by header {}'.format(
-            loopback, header))
-    # If a node A dominates B, it also dominates each of preds[B].
-    # Since header dominates loopback, it also dominates all its preds and
-    # preds of those preds, etc.
-    loop = set()
-    q = deque([loopback])
-    while q:
-        node = q.popleft()
-        loop.add(node)
-        if node == header:
-            continue
-        assert header in doms[node],\
-          'Expected {} to be dominated by header {}'.format(node, header)
-        for pred in preds[node]:
-            if pred not in loop:
-                q.append(pred)
-    return loop
-
-
-def _dfs_cfg(cfg: List[List[int]],
-             on_node_visit=None,
-             on_node_process=None,
-             on_back_edge=None,
-             blocks=None):
-    """Runs DFS on the given CFG.
-
-    If `blocks` is given it is a list of block IDs, and DFS is run once for each
-    of the block ids in that list. If not given, DFS is attempted on all nodes
-    in the graph.
-
-    Calls:
-      - on_node_visit(cfg, dominators, predecessors, node) the first time a
-      node is encountered.
-      - on_node_process(cfg, dominators, predecessors, node) when the DFS
-      for a node has finished.
-      - on_back_edge(cfg, dominators, predecessors, head, tail) for each
-      back-edge (tail->head).
-
-      In the above callbacks,
-      * dominators[i]: set = dominators of node i,
-      * predecessors[i]: list = preds of node i,
+class Loop:
+    """A natural loop: the header, and all blocks that can reach one of the
+    latches (blocks with a back edge to the header) without passing through
+    the header. Loops sharing a header are merged."""
+    def __init__(self, header: int):
+        self.header = header
+        # Sorted lists of block ids.
+        self.latches = []
+        self.exits = []
+        # All blocks of the loop, including those of nested loops.
+        self.blocks = set()
+        self.parent = None
+        self.children = []
+        # 1 for outermost loops.
+        self.depth = 1
+
+    def __repr__(self):
+        return 'Loop(header={}, blocks={}, depth={})'.format(
+            self.header, sorted(self.blocks), self.depth)
+
+
+class LoopForest:
+    """The natural loops of a CFG and how they nest, built like LLVM's
+    LoopInfo.
+
+    Headers are visited innermost first (children before parents in the
+    dominator tree). Each loop is found by walking backwards from its latches;
+    on reaching a block of an already discovered loop, the walk continues from
+    the header of its outermost enclosing loop, which becomes a child of the
+    new loop. Each block is thus walked over once per loop it is the header
+    of, or directly contained in.
+
+    Only blocks reachable from the entry are considered. Back edges whose head
+    does not dominate their tail (in irreducible regions) form no loop.
+
+    Attributes:
+      top_level: the outermost loops, by header preorder in the dominator tree.
+      loop_of: loop_of[block] is the innermost Loop containing block, or None.
     """
-
-    visited = set()
-    processed = set()
-    doms = dominators(cfg)
-    preds = predecessor_map(cfg)
-
-    def _dfs(idx):
-        visited.add(idx)
-        if on_node_visit is not None:
-            on_node_visit(cfg, doms, preds, idx)
-        for succ in cfg[idx]:
-            if succ not in visited:
-                _dfs(succ)
-            elif (succ in visited and succ not in processed
-                  and on_back_edge is not None):
-                on_back_edge(cfg, doms, preds, succ, idx)
-        processed.add(idx)
-        if on_node_process is not None:
-            on_node_process(cfg, doms, preds, idx)
-
-    if blocks is None:
-        blocks = range(len(cfg))
-    for i in blocks:
-        _dfs(i)
-
-
-def extract_natural_loops(cfg: List[List[int]]) -> List[Set[int]]:
-    """Returns all natural loops in `cfg`."""
-    loops = []
-
-    def on_back_edge(cfg, doms, preds, header, curr):
-        try:
-            loop = _extract_loop(cfg, doms, preds, header, curr)
-            loops.append((header, loop))
-        except NotANaturalLoop:
-            pass
-
-    _dfs_cfg(cfg, on_back_edge=on_back_edge)
-    return loops
+    def __init__(self, cfg: List[List[int]], dom: DominanceQuery = None):
+        cfg = CFG.of(cfg)
+        if dom is None:
+            dom = DominanceQuery(immediate_dominators(cfg))
+        n = len(cfg)
+        loop_of = [None] * n
+
+        # Reachable nodes, in dominator tree preorder.
+        dom_preorder = [node for _, node in sorted(
+            (pre, node) for node, pre in enumerate(dom.pre) if pre != -1)]
+        reachable = cfg.reachable_from_entry
+
+        found = []
+        for header in reversed(dom_preorder):
+            latches = [
+                p for p in cfg.preds(header)
+                if reachable(p) and dom.dominates(header, p)
+            ]
+            if not latches:
+                continue
+            loop = Loop(header)
+            loop.latches = sorted(set(latches))
+            found.append(loop)
+            worklist = latches
+            while worklist:
+                node = worklist.pop()
+                sub = loop_of[node]
+                if sub is None:
+                    loop_of[node] = loop
+                    if node != header:
+                        worklist.extend(p for p in cfg.preds(node)
+                                        if reachable(p))
+                    continue
+                while sub.parent is not None:
+                    sub = sub.parent
+                if sub is loop:
+                    continue
+                sub.parent = loop
+                loop.children.append(sub)
+                worklist.extend(p for p in cfg.preds(sub.header)
+                                if reachable(p))
+
+        # found lists inner loops before the loops containing them.
+        for node, loop in enumerate(loop_of):
+            if loop is not None:
+                loop.blocks.add(node)
+        for loop in found:
+            loop.children.sort(key=lambda child: dom.pre[child.header])
+            for child in loop.children:
+                loop.blocks.update(child.blocks)
+            loop.exits = sorted({
+                succ
+                for node in loop.blocks for succ in cfg.succs(node)
+                if succ not in loop.blocks
+            })
+        self.top_level = sorted((loop for loop in found if loop.parent is None),
+                                key=lambda loop: dom.pre[loop.header])
+        for loop in self.preorder():
+            if loop.parent is not None:
+                loop.depth = loop.parent.depth + 1
+        self.loop_of = loop_of
+
+    def preorder(self) -> List[Loop]:
+        """Returns all loops, each before the loops nested in it."""
+        acc = []
+        stack = self.top_level[::-1]
+        while stack:
+            loop = stack.pop()
+            acc.append(loop)
+            stack.extend(reversed(loop.children))
+        return acc
+
+    def innermost_first(self) -> List[Loop]:
+        """Returns all loops, each after the loops nested in it."""
+        return self.preorder()[::-1]
+
+    def depth(self, block: int) -> int:
+        """Returns the number of loops containing `block`."""
+        loop = self.loop_of[block]
+        return 0 if loop is None else loop.depth
+
+
+def extract_natural_loops(cfg: List[List[int]], dom=None) -> List[Set[int]]:
+    """Returns all natural loops in `cfg`, as (header, blocks) pairs, outer
+    loops first. `dom` is a DominanceQuery for `cfg`, if already known."""
+    return [(loop.header, loop.blocks)
+            for loop in LoopForest(cfg, dom).preorder()]
+
+
+def irreducible_edges(cfg: List[List[int]],
+                      dom=None) -> List[Tuple[int, int]]:
+    """Returns the (tail, head) back edges of the DFS of `cfg` whose head does
+    not dominate their tail. A CFG is reducible iff there are none, i.e., iff
+    every back edge closes a natural loop. `dom` is a DominanceQuery for `cfg`,
+    if already known."""
+    cfg = CFG.of(cfg)
+    if dom is None:
+        dom = DominanceQuery(immediate_dominators(cfg))
+    return [(tail, head) for tail, head in cfg.dfs().back_edges
+            if not dom.dominates(head, tail)]
+
+
+def irreducible_regions(cfg: List[List[int]], dom=None) -> List[Set[int]]:
+    """Returns the strongly connected components of `cfg` containing an
+    irreducible edge, i.e., the cycles that have more than one entry."""
+    cfg = CFG.of(cfg)
+    edges = irreducible_edges(cfg, dom)
+    if not edges:
+        return []
+    components = cfg.sccs()
+    component_of = array('i', bytes(4 * len(cfg)))
+    for i, component in enumerate(components):
+        for node in component:
+            component_of[node] = i
+    # The ends of a back edge are always in the same component.
+    offending = dict.fromkeys(component_of[tail] for tail, _ in edges)
+    return [set(components[i]) for i in offending]
 
 
 def is_cfg_reducible(cfg: List[List[int]]) -> bool:
     """Returns if the given CFG is reducible, i.e., if each back-edge in the
     CFG forms a natural loop."""
-    is_reducible = True
+    return not irreducible_edges(cfg)
 
-    def on_back_edge(cfg, doms, preds, header, curr):
-        nonlocal is_reducible
-        if not is_reducible:
-            return
-        try:
-            loop = _extract_loop(cfg, doms, preds, header, curr)
-        except NotANaturalLoop:
-            is_reducible = False
 
-    _dfs_cfg(cfg, on_back_edge=on_back_edge)
-    return is_reducible
+@analysis('predecessors', cfg_only=True)
+def _func_predecessors(func: Function) -> List[List[int]]:
+    return predecessor_map(func.cfg)
+
+
+@analysis('rpo', cfg_only=True)
+def _func_rpo(func: Function) -> List[int]:
+    return list(func.cfg.reverse_postorder())
+
+
+@analysis('idom', cfg_only=True)
+def _func_idom(func: Function) -> array:
+    return immediate_dominators(func.cfg)
+
+
+@analysis('dominators', cfg_only=True)
+def _func_dominators(func: Function) -> List[Set[int]]:
+    return dominator_sets(func.analyses.get('idom'))
+
+
+@analysis('dominance', cfg_only=True)
+def _func_dominance(func: Function) -> DominanceQuery:
+    return DominanceQuery(func.analyses.get('idom'))
+
+
+@analysis('irreducible_regions', cfg_only=True)
+def _func_irreducible_regions(func: Function) -> List[Set[int]]:
+    return irreducible_regions(func.cfg, dom=func.analyses.get('dominance'))
+
+
+@analysis('loop_forest', cfg_only=True)
+def _func_loop_forest(func: Function) -> LoopForest:
+    return LoopForest(func.cfg, dom=func.analyses.get('dominance'))
+
+
+@analysis('loops', cfg_only=True)
+def _func_loops(func: Function):
+    return [(loop.header, loop.blocks)
+            for loop in func.analyses.get('loop_forest').preorder()]
 
 
 def _instr(func, block_id, instr_id):
@@ -224,9 +418,30 @@ def _get_reaching_def_blocks(block_reaching_defs: Dict[str, Set[Tuple[int,
     return {block_id for block_id, _ in block_reaching_defs[varname]}
 
 
+def _has_other_defs(func: Function, def_sites, loop_defs) -> bool:
+    """Returns if `def_sites` has a def of the same variable as one of
+    `loop_defs`, other than that def."""
+    loop_vars = set()
+    for block_id, instr_id in loop_defs:
+        loop_vars.add(func.blocks[block_id][instr_id].dest_id)
+    if len(loop_vars) < len(loop_defs):
+        return True
+    for block_id, instr_id in def_sites:
+        if block_id is None:
+            # Function params have ids 0..len(args)-1.
+            var = instr_id
+        elif (block_id, instr_id) in loop_defs:
+            continue
+        else:
+            var = func.blocks[block_id][instr_id].dest_id
+        if var in loop_vars:
+            return True
+    return False
+
+
 def _find_invariant_instrs(func: Function, loop: Set[int],
-                           reaching_defs: ReachingDefsMap,
-                           dominators: List[Set[int]]):
+                           def_use: DefUseIndex, dom: DominanceQuery,
+                           liveness: Liveness):
     """Returns a list of (block_idx, instr_idx) pairs that point to instructions
     inside the given natural `loop` that are invariant w.r.t. that loop, and are
     safe to move outside.
@@ -235,76 +450,71 @@ def _find_invariant_instrs(func: Function, loop: Set[int],
       func: Function containing the given loop.
       loop: Loop, as a set of block ids constituting the loop, to find LI
       instructions in.
-      reaching_defs: All reaching definitions at the end of each block in
-      `func`.
-      dominators: dominators[block_id] = set of block ids that dominate
-      block_id.
+      def_use: DefUseIndex of `func`.
+      dom: DominanceQuery for the CFG of `func`.
+      liveness: Liveness of `func`.
     
     """
-    li_instrs = set()
-
-    # var_uses[(block_id, instr_id, varname)] = set of blocks that use varname
-    # defined at block_id, instr_id.
-    var_uses = dict()
-    changed = True
-    while changed:
-        changed = False
-        for block_id in loop:
-            block = func.blocks[block_id]
-            for instr_id, instr in enumerate(block):
-                logging.debug('[LICM] processing instr {}'.format(
-                    _instr(func, block_id, instr_id)))
-                if can_have_side_effects(instr):
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    # An instr is LI if, for each arg, either:
+    # - All its reaching defs are from outside the loop, OR
+    # - It has a single reaching def, which is itself LI.
+    # So each candidate instr waits on the distinct in-loop defs reaching its
+    # args: num_pending[site] counts those not known to be LI yet, and
+    # users[def_site] lists the candidates waiting on def_site. Instrs are
+    # marked LI from a worklist as their count drops to zero, so each
+    # candidate and each of its reaching defs is looked at once.
+    num_pending = {}
+    users = {}
+    worklist = []
+
+    for block_id in loop:
+        for instr_id, instr in enumerate(func.blocks[block_id]):
+            if can_have_side_effects(instr):
+                if debug:
                     logging.debug(
-                        'Skipping possible side-effect-causing instr {}'.
-                        format(_instr(func, block_id, instr_id)))
-                    continue
-
-                if (block_id, instr_id) in li_instrs:
-                    continue
+                        'Skipping possible side-effect-causing instr %s',
+                        _instr(func, block_id, instr_id))
+                continue
+            site = (block_id, instr_id)
+            # func params are handled automatically since block_id = None in
+            # those cases.
+            in_loop_reaching_defs = {
+                def_site
+                for def_site in def_use.defs(site) if def_site[0] in loop
+            }
+            if in_loop_reaching_defs and _has_other_defs(
+                    func, def_use.defs(site), in_loop_reaching_defs):
+                # Some arg may take its value from different defs, which
+                # are not all outside the loop.
+                if debug:
+                    logging.debug('Instr %s has several defs of an arg',
+                                  _instr(func, block_id, instr_id))
+                continue
+            num_pending[site] = len(in_loop_reaching_defs)
+            for def_site in in_loop_reaching_defs:
+                users.setdefault(def_site, []).append(site)
+            if not in_loop_reaching_defs:
+                worklist.append(site)
+            elif debug:
+                logging.debug('Instr %s waits on reaching defs in the loop: %s',
+                              _instr(func, block_id, instr_id),
+                              _instrs(func, in_loop_reaching_defs))
 
-                # For instr to be LI, for each arg, each reaching def of this
-                # arg must be either:
-                # - From outside the loop, OR
-                # - Itself LI.
-                is_loop_invariant = True
-                for argname in instr['args']:
-                    logging.debug('  Processing argument {}'.format(argname))
-                    arg_reaching_defs = reaching_defs[block_id][argname]
-                    logging.debug('    Reaching defs: {}'.format(
-                        _instrs(func, reaching_defs[block_id][argname])))
-                    in_loop_reaching_defs = {
-                        # func params are handled automatically since
-                        # block_id = None in those cases.
-                        (block_id, instr_id)
-                        for block_id, instr_id in arg_reaching_defs
-                        if block_id in loop
-                    }
-                    for def_block_id, def_instr_id in in_loop_reaching_defs:
-                        var_uses.setdefault(
-                            (def_block_id, def_instr_id, argname),
-                            set()).add(block_id)
-
-                    if in_loop_reaching_defs and not li_instrs.issuperset(
-                            in_loop_reaching_defs):
-                        logging.debug(
-                            'Instr {} NOT LI because all the reaching defs from inside the loop are not LI: {}'
-                            .format(
-                                _instr(func, block_id, instr_id),
-                                _instrs(
-                                    func,
-                                    in_loop_reaching_defs.difference(
-                                        li_instrs))))
-                        is_loop_invariant = False
-
-                if is_loop_invariant:
-                    logging.debug('Marking instruction {} ({}) as LI'.format(
-                        (block_id, instr_id), instr))
-                    li_instrs.add((block_id, instr_id))
-                    changed = True
-    logging.debug('Loop invariant code motion candidates: {}'.format([
-        (b, i, func.blocks[b][i]) for b, i in li_instrs
-    ]))
+    li_instrs = set()
+    while worklist:
+        site = worklist.pop()
+        li_instrs.add(site)
+        if debug:
+            logging.debug('Marking instruction %s as LI', _instr(func, *site))
+        for user in users.get(site, ()):
+            num_pending[user] -= 1
+            if not num_pending[user]:
+                worklist.append(user)
+    if debug:
+        logging.debug('Loop invariant code motion candidates: %s',
+                      [(b, i, func.blocks[b][i]) for b, i in li_instrs])
 
     # For an LI instruction to be safe for motion,
     # 1. It must dominate all uses in the loop, AND,
@@ -312,56 +522,65 @@ def _find_invariant_instrs(func: Function, loop: Set[int],
     # 3. The var must be dead in all blocks after the loop exit, AND,
     # 4. It must be safe (no side effects/possible exceptions).
 
-    # Find all blocks reachable from each of the loop blocks. ASSUMING
-    # dead-code-elimination has run before this LICM pass, we will not touch
-    # definitions of variables that are used in any block reachable from a
-    # loop block.
-    downstream_blocks = set()
-
-    def _on_node_visit(_f, _d, _p, block_id):
-        if block_id not in loop:
-            downstream_blocks.add(block_id)
-
-    _dfs_cfg(func.block_exits, blocks=loop, on_node_visit=_on_node_visit)
-
-    logging.debug(
-        'Downstream blocks from the loop: {}'.format(downstream_blocks))
-
-    # TODO: The following (defs_used_downstream computation) is really messy, we
-    # should be able to tweak how var_uses is populated above to get rid of the
-    # extra pass.
-    # Variable names that the current set of loop invariant ops define.
-    li_defvars = set(func.blocks[b][i]['dest'] for b, i in li_instrs)
-    defs_used_downstream = set()
-    for block_id in downstream_blocks:
-        if block_id >= len(func.blocks):
-            continue
-        for instr in func.blocks[block_id]:
-            defs_used_downstream.update(
-                li_defvars.intersection(instr.get('args', [])))
-
-    logging.debug('Variables used downstream of the loop: {}'.format(
-        defs_used_downstream))
+    # The value of an LI def must not be used after the loop, i.e., its var
+    # must not be live on entry to a block that the loop exits to.
+    exits = {
+        succ
+        for block_id in loop for succ in func.cfg.succs(block_id)
+        if succ not in loop
+    }
+    live_at_exits = 0
+    for block_id in exits:
+        live_at_exits |= liveness.live_in(block_id)
+
+    # Nor may the value from before the loop be used in it, e.g., by a use
+    # that runs before the def in the first iteration, or that is reached by
+    # another def of the var in the loop. That is, the var must not be live on
+    # entry to the header, the only block of the loop entered from outside (or
+    # the entry block of the function).
+    live_at_entry = 0
+    for block_id in loop:
+        if block_id == 0 or any(pred not in loop
+                                for pred in func.cfg.preds(block_id)):
+            live_at_entry |= liveness.live_in(block_id)
+
+    if debug:
+        logging.debug('Variables live after the loop: %s',
+                      liveness.names(live_at_exits))
+        logging.debug('Variables live on entry to the loop: %s',
+                      liveness.names(live_at_entry))
 
     movable_instrs = set()
     for block_id, instr_id in li_instrs:
-        varname = func.blocks[block_id][instr_id]['dest']
-        if not var_uses.get((block_id, instr_id, varname)):
+        instr = func.blocks[block_id][instr_id]
+        loop_uses = [
+            use_site for use_site in def_use.uses((block_id, instr_id))
+            if use_site[0] in loop
+        ]
+        if not loop_uses:
             continue
 
-        if varname in defs_used_downstream:
+        if live_at_exits >> instr.dest_id & 1:
+            logging.debug('Variable %s is used downstream of the loop, skipping',
+                          instr.dest)
+            continue
+        if live_at_entry >> instr.dest_id & 1:
             logging.debug(
-                'Variable {} is used downstream of the loop, skipping'.format(
-                    varname))
+                'Variable %s is used in the loop before its def, skipping',
+                instr.dest)
             continue
 
         is_movable = True
-        for using_block_id in var_uses[block_id, instr_id, varname]:
-            if block_id not in dominators[using_block_id]:
-                logging.debug(
-                    'For LI instr {}, the block does not dominate a '
-                    'use in block {} of the loop, should skip!'.format(
-                        _instr(func, block_id, instr_id), using_block_id))
+        for using_block_id, using_instr_id in loop_uses:
+            # A use before the def in the same block sees the value of the
+            # previous iteration, or of a def before the loop.
+            if not dom.dominates(block_id, using_block_id) or (
+                    using_block_id == block_id and using_instr_id <= instr_id):
+                if debug:
+                    logging.debug(
+                        'For LI instr %s, the block does not dominate a '
+                        'use in block %s of the loop, should skip!',
+                        _instr(func, block_id, instr_id), using_block_id)
                 is_movable = False
                 break
 
@@ -372,53 +591,74 @@ def _find_invariant_instrs(func: Function, loop: Set[int],
 
 
 def _add_preheader_block(func: Function, instrs: List[Dict], header_id: int,
-                         header_label: str):
-    for block_id, exits in enumerate(func.block_exits):
-        for i, exit in enumerate(exits):
-            if exit == len(func.blocks):
-                exits[i] += 1
+                         header_label: str, loop: Set[int]):
+    """Inserts a block running `instrs` right before the header of `loop`, and
+    sends the edges entering the loop from outside to it. The latches keep
+    jumping to the header."""
     preheader_label = '__preheader_{}'.format(header_label)
     preheader = [mklabel(preheader_label)]
     for instr in instrs:
         preheader.append(instr)
     preheader.append(mkjmp(header_label))
-    preheader_id = len(func.blocks)
+    # Blocks that fell through into the header now fall through into the
+    # preheader, which is what blocks outside the loop should do.
+    preheader_id = header_id
+    header_id += 1
+    func.insert_block(preheader_id, preheader, [header_id])
+    loop = {block_id + 1 if block_id >= preheader_id else block_id
+            for block_id in loop}
     for block_id, block in enumerate(func.blocks):
-        if not block:
+        if block_id == preheader_id or header_id not in func.block_exits[
+                block_id]:
+            continue
+        falls_through = not block or not is_terminator(block[-1])
+        if block_id in loop:
+            if falls_through:
+                # A latch falling through into the header.
+                func.mutable_block(block_id).append(mkjmp(header_label))
             continue
-        instr = block[-1]
-        if is_terminator(instr) and instr['op'] in ('jmp', 'br'):
-            instr['labels'] = [
+        if not falls_through:
+            instr = func.mutable_block(block_id)[-1]
+            instr.labels = [
                 preheader_label if label == header_label else label
-                for label in instr['labels']
-            ]
-            func.block_exits[block_id] = [
-                preheader_id if target == header_id else target
-                for target in func.block_exits[block_id]
+                for label in instr.labels
             ]
-    func.blocks.append(preheader)
-    func.block_exits.append([header_id])
+        func.set_block_exits(block_id, [
+            preheader_id if target == header_id else target
+            for target in func.block_exits[block_id]
+        ])
 
 
+@transform(preserves=())
 def loop_invariant_code_motion(func: Function) -> Function:
     func = func.copy()
-    doms = dominators(func.block_exits)
-    defs = reaching_defs(func)
-    li = []
     inv_label_index = {
         block_id: label
         for label, block_id in func.label_index.items()
     }
-    for header_id, loop in extract_natural_loops(func.block_exits):
+    # Adding a preheader changes the CFG, and so drops the cached analyses: the
+    # loop forest, dominance, def-use chains and liveness are recomputed after
+    # each preheader is added, before processing the next loop. That way outer
+    # loops contain the preheaders of the loops nested in them. Loops are
+    # identified by the labels of their headers, which stay valid across
+    # changes.
+    header_labels = [
+        inv_label_index[loop.header]
+        for loop in func.analyses.get('loop_forest').innermost_first()
+    ]
+    for header_label in header_labels:
+        header_id = func.label_index[header_label]
+        loop = func.analyses.get('loop_forest').loop_of[header_id].blocks
         logging.debug('[LICM] Processing loop {}'.format(loop))
-        instr_ids = _find_invariant_instrs(func, loop, defs, doms)
+        instr_ids = _find_invariant_instrs(func, loop,
+                                           func.analyses.get('def_use'),
+                                           func.analyses.get('dominance'),
+                                           func.analyses.get('live_vars'))
         if not instr_ids:
             continue
         instrs = [
             func.blocks[block_id][instr_id]
             for block_id, instr_id in sorted(instr_ids)
         ]
-        header_label = inv_label_index[header_id]
-        if instrs:
-            _add_preheader_block(func, instrs, header_id, header_label)
+        _add_preheader_block(func, instrs, header_id, header_label, loop)
     return func
@@ -1,6 +1,12 @@
+import random
 import unittest
+from unittest import mock
 from .basic_blocks import BBProgram
+from . import global_analysis
 from .global_analysis import dominators, dominator_tree, extract_natural_loops
+from .global_analysis import immediate_dominators, DominanceQuery
+from .global_analysis import postorder_blocks, topological_sort, LoopForest
+from .global_analysis import irreducible_edges, irreducible_regions
 from .global_analysis import is_cfg_reducible, loop_invariant_code_motion
 from . import parser
 from pprint import pformat
@@ -19,6 +25,80 @@ class GlobalAnalysisTest(unittest.TestCase):
             {0, 1, 5, 6},
         ])
 
+    def test_immediate_dominators(self):
+        cfg = [[1], [5, 2], [3, 4], [4], [1], [6], []]
+        self.assertEqual(list(immediate_dominators(cfg)),
+                         [-1, 0, 1, 2, 2, 1, 5])
+        self.assertEqual(list(immediate_dominators([])), [])
+
+        # Nodes 2 and 3 are unreachable from the entry.
+        cfg = [[1], [], [1, 3], [2]]
+        self.assertEqual(list(immediate_dominators(cfg)), [-1, 0, -1, -1])
+        self.assertEqual(dominators(cfg), [{0}, {0, 1}, {0, 1, 2, 3},
+                                           {0, 1, 2, 3}])
+
+    def test_dominators_of_random_cfgs(self):
+        def reachable(cfg, removed):
+            seen = set()
+            stack = [0] if removed != 0 else []
+            while stack:
+                node = stack.pop()
+                if node not in seen:
+                    seen.add(node)
+                    stack.extend(s for s in cfg[node] if s != removed)
+            return seen
+
+        rng = random.Random(0)
+        for _ in range(50):
+            n = rng.randrange(1, 15)
+            cfg = [rng.sample(range(n), rng.randrange(min(n, 3) + 1))
+                   for _ in range(n)]
+            all_reachable = reachable(cfg, None)
+            expected = []
+            for node in range(n):
+                if node not in all_reachable:
+                    expected.append(set(range(n)))
+                else:
+                    expected.append({
+                        d
+                        for d in range(n)
+                        if node == d or node not in reachable(cfg, d)
+                    })
+            self.assertEqual(dominators(cfg), expected, cfg)
+
+            dom = DominanceQuery(immediate_dominators(cfg))
+            for a in range(n):
+                for b in range(n):
+                    self.assertEqual(dom.dominates(a, b), a in expected[b])
+                    self.assertEqual(dom.strictly_dominates(a, b), a != b
+                                     and a in expected[b])
+                    if a in all_reachable and b in all_reachable:
+                        common = expected[a] & expected[b]
+                        nearest = max(common, key=lambda d: len(expected[d]))
+                        self.assertEqual(dom.nearest_common_dominator(a, b),
+                                         nearest)
+
+    def test_dominance_query(self):
+        cfg = [[1], [5, 2], [3, 4], [4], [1], [6], [], [3]]
+        dom = DominanceQuery(immediate_dominators(cfg))
+        self.assertTrue(dom.dominates(1, 4))
+        self.assertTrue(dom.dominates(4, 4))
+        self.assertFalse(dom.strictly_dominates(4, 4))
+        self.assertFalse(dom.dominates(3, 4))
+        self.assertEqual(dom.nearest_common_dominator(3, 4), 2)
+        self.assertEqual(dom.nearest_common_dominator(4, 6), 1)
+        self.assertEqual(dom.nearest_common_dominator(0, 6), 0)
+        # Node 7 is unreachable.
+        self.assertTrue(dom.dominates(6, 7))
+        self.assertFalse(dom.dominates(7, 6))
+        self.assertEqual(dom.nearest_common_dominator(7, 6), 6)
+
+    def test_dominators_of_long_chain(self):
+        n = 50000
+        cfg = [[i + 1] for i in range(n - 1)] + [[]]
+        idom = immediate_dominators(cfg)
+        self.assertEqual(list(idom), [-1] + list(range(n - 1)))
+
     def test_dominator_tree(self):
         cfg = [[1], [5, 2], [3, 4], [4], [1], [6], []]
         self.assertEqual(dominator_tree(cfg), [
@@ -43,12 +123,61 @@ class GlobalAnalysisTest(unittest.TestCase):
         self.assertEqual(extract_natural_loops(cfg=[[1, 2], [3], [3], [1]]),
                          [])
 
+    def test_loop_forest(self):
+        # 1 heads a loop with latches 5 and 6, containing the loop 2 <- 3,
+        # and 7 heads a self loop. 8 is unreachable.
+        cfg = [[1], [2], [3], [2, 4], [5, 6], [1], [1, 7], [7, 9], [7], []]
+        forest = LoopForest(cfg)
+        outer, self_loop = forest.top_level
+        inner, = outer.children
+        self.assertEqual(outer.header, 1)
+        self.assertEqual(outer.latches, [5, 6])
+        self.assertEqual(outer.blocks, {1, 2, 3, 4, 5, 6})
+        self.assertEqual(outer.exits, [7])
+        self.assertEqual(outer.depth, 1)
+        self.assertIs(inner.parent, outer)
+        self.assertEqual(inner.header, 2)
+        self.assertEqual(inner.latches, [3])
+        self.assertEqual(inner.blocks, {2, 3})
+        self.assertEqual(inner.exits, [4])
+        self.assertEqual(inner.depth, 2)
+        self.assertEqual(self_loop.blocks, {7})
+        self.assertEqual(self_loop.latches, [7])
+        self.assertEqual(self_loop.exits, [9])
+        self.assertEqual(forest.innermost_first(), [self_loop, inner, outer])
+        self.assertEqual([forest.depth(i) for i in range(10)],
+                         [0, 1, 2, 2, 1, 1, 1, 1, 0, 0])
+        self.assertEqual(extract_natural_loops(cfg),
+                         [(1, {1, 2, 3, 4, 5, 6}), (2, {2, 3}), (7, {7})])
+
+    def test_deep_cfgs(self):
+        # A chain of 10000 blocks that loops back to block 1.
+        n = 10000
+        cfg = [[i + 1] for i in range(n - 1)] + [[1]]
+        self.assertEqual(postorder_blocks(cfg), list(range(n - 1, -1, -1)))
+        self.assertEqual(list(topological_sort(cfg)), list(range(n)))
+        self.assertEqual(extract_natural_loops(cfg),
+                         [(1, set(range(1, n)))])
+        self.assertTrue(is_cfg_reducible(cfg))
+
     def test_is_cfg_reducible(self):
         self.assertTrue(
             is_cfg_reducible(cfg=[[1], [5, 2], [3, 4], [4], [1], [6], []]))
         self.assertFalse(is_cfg_reducible(cfg=[[1, 2], [2], [1]]))
         self.assertFalse(is_cfg_reducible(cfg=[[1, 2], [3], [3], [1]]))
 
+    def test_irreducible_regions(self):
+        reducible = [[1], [5, 2], [3, 4], [4], [1], [6], []]
+        self.assertEqual(irreducible_edges(reducible), [])
+        self.assertEqual(irreducible_regions(reducible), [])
+
+        # 1 <-> 2 can be entered at both 1 and 2, and so can 4 <-> 5, while
+        # 3 heads a natural loop.
+        cfg = [[1, 2], [2], [1, 3], [3, 4, 5], [5], [4, 6], []]
+        self.assertEqual(irreducible_edges(cfg), [(2, 1), (5, 4)])
+        self.assertEqual(irreducible_regions(cfg), [{1, 2}, {4, 5}])
+        self.assertFalse(is_cfg_reducible(cfg))
+
     def test_loop_invariant_code_motion1(self):
         bbprog = BBProgram(prog=parser.parse("""
           @main() {
@@ -166,6 +295,21 @@ class GlobalAnalysisTest(unittest.TestCase):
                     'value': 10
                 },
             ],
+            [
+                {
+                    'label': '__preheader_loop'
+                },
+                {
+                    'args': ['j', 'j'],
+                    'dest': 'incr',
+                    'op': 'add',
+                    'type': 'int'
+                },
+                {
+                    'op': 'jmp',
+                    'labels': ['loop']
+                },
+            ],
             [
                 {
                     'label': 'loop'
@@ -203,7 +347,7 @@ class GlobalAnalysisTest(unittest.TestCase):
                     'type': 'int'
                 },
                 {
-                    'labels': ['__preheader_loop'],
+                    'labels': ['loop'],
                     'op': 'jmp'
                 },
             ],
@@ -212,21 +356,6 @@ class GlobalAnalysisTest(unittest.TestCase):
                     'label': 'exit'
                 },
             ],
-            [
-                {
-                    'label': '__preheader_loop'
-                },
-                {
-                    'args': ['j', 'j'],
-                    'dest': 'incr',
-                    'op': 'add',
-                    'type': 'int'
-                },
-                {
-                    'op': 'jmp',
-                    'labels': ['loop']
-                },
-            ],
         ]
         main = bbprog.funcs['main']
         optmain = loop_invariant_code_motion(main)
@@ -504,6 +633,21 @@ class GlobalAnalysisTest(unittest.TestCase):
                     'value': 0
                 },
             ],
+            [
+                {
+                    'label': '__preheader_loop'
+                },
+                {
+                    'args': ['j', 'j'],
+                    'dest': 'incr',
+                    'op': 'add',
+                    'type': 'int'
+                },
+                {
+                    'op': 'jmp',
+                    'labels': ['loop']
+                },
+            ],
             [
                 {
                     'label': 'loop'
@@ -541,7 +685,7 @@ class GlobalAnalysisTest(unittest.TestCase):
                     'type': 'int'
                 },
                 {
-                    'labels': ['__preheader_loop'],
+                    'labels': ['loop'],
                     'op': 'jmp'
                 },
             ],
@@ -550,21 +694,6 @@ class GlobalAnalysisTest(unittest.TestCase):
                     'label': 'exit'
                 },
             ],
-            [
-                {
-                    'label': '__preheader_loop'
-                },
-                {
-                    'args': ['j', 'j'],
-                    'dest': 'incr',
-                    'op': 'add',
-                    'type': 'int'
-                },
-                {
-                    'op': 'jmp',
-                    'labels': ['loop']
-                },
-            ],
         ]
         main = bbprog.funcs['main']
         optmain = loop_invariant_code_motion(main)
@@ -699,3 +828,204 @@ class GlobalAnalysisTest(unittest.TestCase):
         optmain = loop_invariant_code_motion(main)
         self.assertEqual(main.blocks, original_blocks)
         self.assertEqual(optmain.blocks, original_blocks)
+
+    def test_loop_invariant_code_motion_of_long_chains(self):
+        # v1 = one + one, v2 = v1 + one, ...
+        n = 2000
+        chain = '\n'.join('v{}: int = add v{} one;'.format(k, k - 1)
+                          for k in range(2, n + 1))
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(limit: int) {
+            .start:
+            i: int = const 0;
+            one: int = const 1;
+            .loop:
+            v1: int = add one one;
+            %s
+            i: int = add i one;
+            done: bool = eq i limit;
+            br done .exit .loop;
+            .exit:
+          }
+        """ % chain))
+        optmain = loop_invariant_code_motion(bbprog.funcs['main'])
+        preheader = optmain.blocks[optmain.label_index['__preheader_loop']]
+        # The preheader is placed right before the header.
+        self.assertEqual(optmain.label_index['loop'],
+                         optmain.label_index['__preheader_loop'] + 1)
+        # v_n is not used in the loop, so it stays.
+        self.assertEqual([instr['dest'] for instr in preheader[1:-1]],
+                         ['v{}'.format(k) for k in range(1, n)])
+
+    def test_loop_invariant_code_motion_keeps_defs_after_uses(self):
+        # x is invariant, but the first iteration prints the x from before
+        # the loop.
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(limit: int) {
+            .start:
+            x: int = const 0;
+            i: int = const 0;
+            one: int = const 1;
+            .loop:
+            y: int = add x one;
+            print y;
+            x: int = const 5;
+            i: int = add i one;
+            done: bool = eq i limit;
+            br done .exit .loop;
+            .exit:
+          }
+        """))
+        main = bbprog.funcs['main']
+        self.assertEqual(loop_invariant_code_motion(main).blocks, main.blocks)
+
+    def test_loop_invariant_code_motion_keeps_defs_live_into_loop(self):
+        # x = add one one is invariant and dominates its only use, but the
+        # print in the header sees the x from before the loop first, and the
+        # doubled x after that.
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(limit: int) {
+            .start:
+            x: int = const 0;
+            i: int = const 0;
+            one: int = const 1;
+            .loop:
+            print x;
+            jmp .body;
+            .body:
+            x: int = add one one;
+            x: int = add x x;
+            i: int = add i one;
+            done: bool = eq i limit;
+            br done .exit .loop;
+            .exit:
+          }
+        """))
+        main = bbprog.funcs['main']
+        self.assertEqual(loop_invariant_code_motion(main).blocks, main.blocks)
+
+    def test_loop_invariant_code_motion_checks_liveness_after_loop(self):
+        # x is used after the loop only after being redefined, so its LI def
+        # can move, unlike that of y, which is printed after the loop.
+        prog = """
+          @main(limit: int) {
+            .start:
+            i: int = const 0;
+            one: int = const 1;
+            .loop:
+            x: int = add one one;
+            y: int = add one one;
+            i: int = add i x;
+            i: int = add i y;
+            done: bool = ge i limit;
+            br done .exit .loop;
+            .exit:
+            x: int = const 0;
+            print x;
+            %s
+          }"""
+        for exit_code, hoisted in (('', ['x', 'y']), ('print y;', ['x'])):
+            bbprog = BBProgram(prog=parser.parse(prog % exit_code))
+            optmain = loop_invariant_code_motion(bbprog.funcs['main'])
+            self.assertEqual(
+                [instr['dest'] for instr in optmain.blocks[1][1:-1]], hoisted)
+
+    def test_loop_invariant_code_motion_preheader_placement(self):
+        """The entry falls through into a loop whose latch is the header
+        itself, and the last block falls off the end of the function."""
+        main = BBProgram(prog=parser.parse("""
+          @main {
+            v0: int = const 1;
+            v1: int = const 1;
+            v2: int = const 0;
+            .b0:
+            print v1;
+            c: bool = gt v2 v0;
+            br c .b0 .b1;
+            .b1:
+            print v2;
+            .end:
+            print v0;
+          }""")).funcs['main']
+        optmain = loop_invariant_code_motion(main)
+        # The entry falls through into the preheader, which comes right
+        # before the header, and the back edge still targets the header.
+        self.assertEqual(
+            [block[0].get('label') for block in optmain.blocks],
+            [None, '__preheader_b0', 'b0', 'b1', 'end'])
+        self.assertEqual(optmain.blocks[1][1:], [{
+            'dest': 'c',
+            'op': 'gt',
+            'type': 'bool',
+            'args': ['v2', 'v0']
+        }, {
+            'op': 'jmp',
+            'labels': ['b0']
+        }])
+        self.assertEqual(optmain.blocks[2][-1]['labels'], ['b0', 'b1'])
+        self.assertEqual(optmain.block_exits,
+                         [[1], [2], [2, 3], [4], [5], []])
+
+    def test_loop_invariant_code_motion_adds_jmp_to_fall_through_latch(self):
+        main = BBProgram(prog=parser.parse("""
+          @main(n: int) {
+            one: int = const 1;
+            i: int = const 0;
+            jmp .head;
+            .latch:
+            i: int = add i x;
+            .head:
+            x: int = add one one;
+            c: bool = lt i n;
+            br c .latch .end;
+            .end:
+            print i;
+          }""")).funcs['main']
+        optmain = loop_invariant_code_motion(main)
+        self.assertEqual(
+            [block[0].get('label') for block in optmain.blocks],
+            [None, 'latch', '__preheader_head', 'head', 'end'])
+        # The entry jumps to the preheader, and the latch, which fell
+        # through into the header, now jumps to it.
+        self.assertEqual(optmain.blocks[0][-1]['labels'],
+                         ['__preheader_head'])
+        self.assertEqual(optmain.blocks[1][-1], {
+            'op': 'jmp',
+            'labels': ['head']
+        })
+        self.assertEqual(optmain.block_exits, [[2], [3], [3], [1, 4], [5], []])
+
+    def test_loop_invariant_code_motion_sees_inner_preheaders(self):
+        """The outer loop is processed after the preheader of the inner loop
+        is added, and must contain it."""
+        main = BBProgram(prog=parser.parse("""
+          @main(n: int) {
+            a: int = const 1;
+            i: int = const 0;
+            .outer:
+            j: int = const 0;
+            .inner:
+            x: int = add a a;
+            j: int = add j x;
+            c: bool = lt j n;
+            br c .inner .outer_latch;
+            .outer_latch:
+            i: int = add i a;
+            d: bool = lt i n;
+            br d .outer .end;
+            .end:
+            print i j;
+          }""")).funcs['main']
+        loops = []
+        find_invariant_instrs = global_analysis._find_invariant_instrs
+
+        def record_loop(func, loop, *args):
+            loops.append({func.blocks[block][0].get('label') for block in loop})
+            return find_invariant_instrs(func, loop, *args)
+
+        with mock.patch.object(global_analysis, '_find_invariant_instrs',
+                               record_loop):
+            loop_invariant_code_motion(main)
+        self.assertEqual(
+            loops,
+            [{'inner'}, {'outer', 'inner', 'outer_latch', '__preheader_inner'}])
@@ -0,0 +1,175 @@
+# GVN extends local value numbering (see local_value_numbering.py) to whole
+# functions: the value table is built while walking the dominator tree, so that
+# a value computed in a block is available in all blocks it dominates, and
+# dropped when the walk leaves that subtree.
+#
+# Bril variables can be assigned many times, so only variables with a single
+# definition (and function arguments never assigned to) get value numbers: a
+# use of such a variable anywhere it is defined refers to the same value.
+# Instructions are only numbered if all their args have value numbers. Keys are
+# simplified as in LVN, so constants are folded across blocks too.
+import logging
+
+from . import basic_blocks
+from .analysis_manager import CFG_ANALYSES, transform
+from .instr import Instr
+from .local_value_numbering import value_key, reconstruct_instr, id_op
+from .util import is_pure
+
+
+def _single_def_vars(func: basic_blocks.Function):
+    """Returns the set of ids of variables with one definition in `func`,
+    counting each argument as a definition."""
+    num_defs = [0] * len(func.symbols)
+    for var in range(len(func.args)):
+        num_defs[var] = 1
+    for block in func.blocks:
+        for instr in block:
+            if instr.dest_id is not None:
+                num_defs[instr.dest_id] += 1
+    return {var for var, n in enumerate(num_defs) if n == 1}
+
+
+def _dominator_tree_preorder(idom):
+    """Yields (block, depth) for the nodes of the dominator tree given by
+    `idom`, in preorder, starting at the entry."""
+    children = [[] for _ in idom]
+    for node, parent in enumerate(idom):
+        if parent != -1:
+            children[parent].append(node)
+    stack = [(0, 0)] if len(idom) else []
+    while stack:
+        node, depth = stack.pop()
+        yield node, depth
+        stack.extend((child, depth + 1) for child in reversed(children[node]))
+
+
+@transform(preserves=CFG_ANALYSES)
+def global_value_numbering(
+        func: basic_blocks.Function) -> basic_blocks.Function:
+    """Returns a copy of `func` where pure value ops that recompute a value
+    available in a dominating instruction are replaced by `id` copies of it,
+    and args refer to the first variable holding their value."""
+    optfunc = func.copy()
+    single_def = _single_def_vars(optfunc)
+
+    # As in LVN, valtable[k] = (value_key, canonical_var). env maps variable
+    # names to value numbers, and valindex maps (value_key, type) to value
+    # numbers. Entries made while processing a block are undone once the walk
+    # leaves the dominator subtree of the block: scopes[d] lists the env and
+    # valindex keys added at depth d of the walk.
+    valtable = []
+    env = {}
+    valindex = {}
+    scopes = []
+
+    for var, arg in enumerate(optfunc.args):
+        if var in single_def:
+            env[arg['name']] = len(valtable)
+            valtable.append((None, arg['name']))
+
+    num_replaced = 0
+    idom = optfunc.analyses.get('idom')
+    for block_idx, depth in _dominator_tree_preorder(idom):
+        if block_idx >= len(optfunc.blocks):
+            # The dummy exit node.
+            continue
+        while len(scopes) > depth:
+            env_keys, valindex_keys = scopes.pop()
+            for name in env_keys:
+                del env[name]
+            for key in valindex_keys:
+                del valindex[key]
+        env_keys, valindex_keys = [], []
+        scopes.append((env_keys, valindex_keys))
+
+        block = optfunc.blocks[block_idx]
+        optblock = []
+        changed = False
+        for instr in block:
+            args = instr.args or ()
+            if not is_pure(instr):
+                # Refer to the canonical vars of args where known.
+                canonical = [
+                    valtable[env[arg]][1] if arg in env else arg
+                    for arg in args
+                ]
+                if instr.args and canonical != instr.args:
+                    instr = instr.copy()
+                    instr['args'] = canonical
+                    changed = True
+                optblock.append(instr)
+                continue
+            if not all(arg in env for arg in args):
+                optblock.append(instr)
+                continue
+
+            if instr.op == 'id':
+                # A copy holds the value of its arg.
+                num = env[args[0]]
+                new_instr = instr
+                if valtable[num][1] != args[0]:
+                    new_instr = Instr.from_bril(
+                        id_op(valtable, num, instr.dest, instr.type))
+            else:
+                key = value_key(env, instr, valtable)
+                if key[0] == 'id':
+                    # The instr simplified to a copy of a value.
+                    num = key[1]
+                else:
+                    num = valindex.get((key, instr.type))
+                if num is not None:
+                    new_instr = Instr.from_bril(
+                        id_op(valtable, num, instr.dest, instr.type))
+                    num_replaced += 1
+                else:
+                    new_instr = reconstruct_instr(valtable, key, instr.dest,
+                                                  instr)
+                    if instr.dest_id in single_def:
+                        num = len(valtable)
+                        valtable.append((key, instr.dest))
+                        valindex[key, instr.type] = num
+                        valindex_keys.append((key, instr.type))
+            if num is not None and instr.dest_id in single_def:
+                env[instr.dest] = num
+                env_keys.append(instr.dest)
+            changed = changed or new_instr != instr
+            optblock.append(new_instr)
+        if changed:
+            optfunc.set_block(block_idx, optblock)
+
+    logging.debug('gvn: replaced %d instrs in function %s', num_replaced,
+                  optfunc.name)
+    return optfunc
+
+
+def gvn(bbprog: basic_blocks.BBProgram) -> basic_blocks.BBProgram:
+    """Returns `bbprog` with global value numbering applied to every
+    function."""
+    optprog = basic_blocks.BBProgram()
+    for name in bbprog.funcs:
+        optprog.funcs[name] = global_value_numbering(bbprog.funcs[name])
+    return optprog
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    import argparse, json, sys
+    from .stream import transform_functions
+    parser = argparse.ArgumentParser(
+        description='Run global value numbering on a bril (JSON) program on '
+        'STDIN')
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Read, optimize and write out one function at a time, so that '
+        'memory use is bounded by the largest function.')
+    args = parser.parse_args()
+    if args.stream:
+        transform_functions(
+            sys.stdin, sys.stdout, lambda func: global_value_numbering(
+                basic_blocks.Function.from_bril(func)).to_bril())
+    else:
+        prog = json.load(sys.stdin)
+        optprog = gvn(basic_blocks.BBProgram(prog))
+        json.dump(optprog.bril_dict(), sys.stdout)
@@ -0,0 +1,172 @@
+import unittest
+from .basic_blocks import BBProgram
+from .global_value_numbering import global_value_numbering, gvn
+from . import parser
+
+
+def _instrs(func):
+    return [instr for block in func.blocks for instr in block]
+
+
+class GlobalValueNumberingTest(unittest.TestCase):
+    def test_values_of_dominating_blocks_are_reused(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(a: int, b: int) {
+            x: int = add a b;
+            c: bool = lt a b;
+            br c .then .else;
+            .then:
+            y: int = add a b;
+            print y;
+            t: int = mul y y;
+            jmp .end;
+            .else:
+            z: int = add a b;
+            e: int = mul z z;
+            print e;
+            .end:
+            w: int = add a b;
+            u: int = mul w w;
+            print u;
+          }"""))
+        optmain = global_value_numbering(bbprog.funcs['main'])
+        self.assertEqual(
+            _instrs(optmain),
+            _instrs(
+                BBProgram(prog=parser.parse("""
+          @main(a: int, b: int) {
+            x: int = add a b;
+            c: bool = lt a b;
+            br c .then .else;
+            .then:
+            y: int = id x;
+            print x;
+            t: int = mul x x;
+            jmp .end;
+            .else:
+            z: int = id x;
+            e: int = mul x x;
+            print e;
+            .end:
+            w: int = id x;
+            u: int = mul x x;
+            print u;
+          }""")).funcs['main']))
+
+    def test_values_of_other_branches_are_not_reused(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(a: int, b: int) {
+            c: bool = lt a b;
+            br c .then .else;
+            .then:
+            y: int = add a b;
+            print y;
+            jmp .end;
+            .else:
+            z: int = add a b;
+            print z;
+            .end:
+            w: int = add a b;
+            print w;
+          }"""))
+        main = bbprog.funcs['main']
+        self.assertEqual(_instrs(global_value_numbering(main)), _instrs(main))
+
+    def test_only_single_def_vars_are_numbered(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(a: int, b: int) {
+            x: int = add a b;
+            x: int = add x a;
+            a: int = const 1;
+            y: int = add a b;
+            z: int = add x b;
+            w: int = add x b;
+            v: int = add b b;
+            u: int = add b b;
+            print y z w v u;
+          }"""))
+        optmain = global_value_numbering(bbprog.funcs['main'])
+        self.assertEqual(
+            _instrs(optmain),
+            _instrs(
+                BBProgram(prog=parser.parse("""
+          @main(a: int, b: int) {
+            x: int = add a b;
+            x: int = add x a;
+            a: int = const 1;
+            y: int = add a b;
+            z: int = add x b;
+            w: int = add x b;
+            v: int = add b b;
+            u: int = id v;
+            print y z w v v;
+          }""")).funcs['main']))
+
+    def test_impure_ops_and_types_are_respected(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(a: int) {
+            x: int = call @f a;
+            y: int = call @f a;
+            t: bool = const true;
+            i: int = const 1;
+            j: int = const 1;
+            print x y t i j;
+          }
+          @f(a: int): int {
+            ret a;
+          }"""))
+        optprog = gvn(bbprog)
+        self.assertEqual(
+            _instrs(optprog.funcs['main']),
+            _instrs(
+                BBProgram(prog=parser.parse("""
+          @main(a: int) {
+            x: int = call @f a;
+            y: int = call @f a;
+            t: bool = const true;
+            i: int = const 1;
+            j: int = id i;
+            print x y t i i;
+          }""")).funcs['main']))
+        self.assertEqual(_instrs(optprog.funcs['f']),
+                         _instrs(bbprog.funcs['f']))
+
+    def test_constants_are_folded_across_blocks(self):
+        bbprog = BBProgram(prog=parser.parse("""
+          @main(a: int) {
+            two: int = const 2;
+            zero: int = const 0;
+            c: bool = lt zero two;
+            br c .then .end;
+            .then:
+            x: int = mul two two;
+            y: int = add a zero;
+            z: int = add zero a;
+            print x y z;
+            .end:
+            w: int = div a zero;
+            print w;
+          }"""))
+        optmain = global_value_numbering(bbprog.funcs['main'])
+        self.assertEqual(
+            _instrs(optmain),
+            _instrs(
+                BBProgram(prog=parser.parse("""
+          @main(a: int) {
+            two: int = const 2;
+            zero: int = const 0;
+            c: bool = const true;
+            br c .then .end;
+            .then:
+            x: int = const 4;
+            y: int = id a;
+            z: int = id a;
+            print x a a;
+            .end:
+            w: int = div a zero;
+            print w;
+          }""")).funcs['main']))
+
+
+if __name__ == '__main__':
+    unittest.main()
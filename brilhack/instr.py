@@ -0,0 +1,280 @@
+"""Compact in-memory representation of Bril instructions.
+
+An `Instr` stores the fields of a Bril JSON instruction in `__slots__` instead
+of a per-instruction dict, with the opcode interned to a small integer that
+indexes a table of opcode properties (`OPCODE_FLAGS`). Hot predicates in
+util.py read these attributes directly.
+
+Instr also implements the mutable mapping interface over the Bril JSON keys
+('op', 'dest', 'args', ...), and compares equal to the equivalent dict, so code
+written against JSON dicts keeps working. Conversion to and from JSON dicts
+only happens at the edges, see `Instr.from_bril` and `Instr.to_bril`.
+"""
+from collections.abc import Mapping, MutableMapping
+
+# Opcode property flags.
+TERMINATOR = 1
+# The op can throw an exception, so executing it speculatively is unsafe.
+MAY_TRAP = 2
+# The result of the op depends only on its args, and the op has no effects
+# other than possibly trapping, so it can be replaced by an earlier evaluation
+# of the op on the same args.
+PURE = 4
+
+# Opcode 0 is reserved for instructions without an op, i.e., labels.
+NO_OPCODE = 0
+
+OPCODE_NAMES = [
+    None,
+    # Core.
+    'const', 'id', 'add', 'mul', 'sub', 'div', 'eq', 'lt', 'gt', 'le', 'ge',
+    'not', 'and', 'or', 'jmp', 'br', 'call', 'ret', 'print', 'nop',
+    # Floating point.
+    'fadd', 'fmul', 'fsub', 'fdiv', 'feq', 'flt', 'fle', 'fgt', 'fge',
+    # Memory.
+    'alloc', 'free', 'store', 'load', 'ptradd',
+    # Characters.
+    'ceq', 'clt', 'cle', 'cgt', 'cge', 'char2int', 'int2char',
+    # SSA and speculation.
+    'phi', 'speculate', 'commit', 'guard',
+]
+OPCODES = {name: code for code, name in enumerate(OPCODE_NAMES)}
+
+_FLAGS_BY_NAME = {
+    'jmp': TERMINATOR,
+    'br': TERMINATOR,
+    'div': MAY_TRAP | PURE,
+}
+for name in ('const', 'id', 'add', 'mul', 'sub', 'eq', 'lt', 'gt', 'le', 'ge',
+             'not', 'and', 'or', 'fadd', 'fmul', 'fsub', 'fdiv', 'feq', 'flt',
+             'fle', 'fgt', 'fge', 'ptradd', 'ceq', 'clt', 'cle', 'cgt', 'cge',
+             'char2int', 'int2char'):
+    _FLAGS_BY_NAME[name] = PURE
+OPCODE_FLAGS = [_FLAGS_BY_NAME.get(name, 0) for name in OPCODE_NAMES]
+
+
+def intern_opcode(name: str) -> int:
+    """Returns the opcode for op `name`, allocating one for unknown ops."""
+    code = OPCODES.get(name)
+    if code is None:
+        code = len(OPCODE_NAMES)
+        OPCODE_NAMES.append(name)
+        OPCODE_FLAGS.append(0)
+        OPCODES[name] = code
+    return code
+
+
+# JSON keys stored in an attribute of the same name.
+_SLOT_KEYS = ('dest', 'type', 'args', 'funcs', 'labels', 'value', 'label')
+
+
+class Instr(MutableMapping):
+    """A Bril instruction. Absent JSON keys are stored as None."""
+    # dest and args are properties over _dest and _args, see below.
+    __slots__ = ('opcode', '_dest', 'type', '_args', 'funcs', 'labels',
+                 'value', 'label', 'extra', 'dest_id', 'arg_ids', 'symbols')
+
+    def __init__(self,
+                 op=None,
+                 dest=None,
+                 type=None,
+                 args=None,
+                 funcs=None,
+                 labels=None,
+                 value=None,
+                 label=None,
+                 extra=None):
+        self.opcode = NO_OPCODE if op is None else intern_opcode(op)
+        self._dest = dest
+        self.type = type
+        self._args = args
+        self.funcs = funcs
+        self.labels = labels
+        self.value = value
+        self.label = label
+        # Dict of any other JSON keys (e.g., source positions), or None.
+        self.extra = extra
+        # Ids of dest and args in the symbol table of the enclosing function,
+        # see basic_blocks.SymbolTable.bind(). None when not bound.
+        self.dest_id = None
+        self.arg_ids = None
+        # The symbol table the ids refer to, so that they are rebound whenever
+        # dest or args are assigned.
+        self.symbols = None
+
+    @classmethod
+    def from_bril(cls, d):
+        """Returns an Instr for the JSON dict `d`. Instrs are returned as is."""
+        if d.__class__ is cls:
+            return d
+        extra = None
+        for key in d:
+            if key != 'op' and key not in _SLOT_KEYS:
+                if extra is None:
+                    extra = {}
+                extra[key] = d[key]
+        args = d.get('args')
+        funcs = d.get('funcs')
+        labels = d.get('labels')
+        return cls(op=d.get('op'),
+                   dest=d.get('dest'),
+                   type=d.get('type'),
+                   args=None if args is None else list(args),
+                   funcs=None if funcs is None else list(funcs),
+                   labels=None if labels is None else list(labels),
+                   value=d.get('value'),
+                   label=d.get('label'),
+                   extra=extra)
+
+    def to_bril(self):
+        """Returns the Bril JSON dict for this instruction."""
+        d = {}
+        if self.opcode != NO_OPCODE:
+            d['op'] = OPCODE_NAMES[self.opcode]
+        if self.dest is not None:
+            d['dest'] = self.dest
+        if self.type is not None:
+            d['type'] = self.type
+        if self.args is not None:
+            d['args'] = self.args[:]
+        if self.funcs is not None:
+            d['funcs'] = self.funcs[:]
+        if self.labels is not None:
+            d['labels'] = self.labels[:]
+        if self.value is not None:
+            d['value'] = self.value
+        if self.label is not None:
+            d['label'] = self.label
+        if self.extra is not None:
+            d.update(self.extra)
+        return d
+
+    @property
+    def op(self):
+        return OPCODE_NAMES[self.opcode]
+
+    @property
+    def flags(self):
+        return OPCODE_FLAGS[self.opcode]
+
+    @property
+    def dest(self):
+        return self._dest
+
+    @dest.setter
+    def dest(self, dest):
+        self._dest = dest
+        symbols = self.symbols
+        self.dest_id = (None if symbols is None or dest is None else
+                        symbols.intern(dest))
+
+    @property
+    def args(self):
+        return self._args
+
+    @args.setter
+    def args(self, args):
+        # Mutating the list in place does not rebind arg_ids; assign a new
+        # list instead.
+        self._args = args
+        symbols = self.symbols
+        self.arg_ids = (None if symbols is None or args is None else tuple(
+            symbols.intern(arg) for arg in args))
+
+    def copy(self):
+        c = Instr.__new__(Instr)
+        c.opcode = self.opcode
+        c._dest = self._dest
+        c.type = self.type
+        c._args = None if self._args is None else self._args[:]
+        c.funcs = None if self.funcs is None else self.funcs[:]
+        c.labels = None if self.labels is None else self.labels[:]
+        c.value = self.value
+        c.label = self.label
+        c.extra = None if self.extra is None else dict(self.extra)
+        c.dest_id = self.dest_id
+        c.arg_ids = self.arg_ids
+        c.symbols = self.symbols
+        return c
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    # Mapping interface over the Bril JSON keys.
+
+    def __getitem__(self, key):
+        if key == 'op':
+            if self.opcode != NO_OPCODE:
+                return OPCODE_NAMES[self.opcode]
+        elif key in _SLOT_KEYS:
+            val = getattr(self, key)
+            if val is not None:
+                return val
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        if key == 'op':
+            return self.opcode != NO_OPCODE
+        if key in _SLOT_KEYS:
+            return getattr(self, key) is not None
+        return self.extra is not None and key in self.extra
+
+    def __setitem__(self, key, val):
+        if key == 'op':
+            self.opcode = intern_opcode(val)
+        elif key in _SLOT_KEYS:
+            setattr(self, key, val)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = val
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key == 'op':
+            self.opcode = NO_OPCODE
+        elif key in _SLOT_KEYS:
+            self[key] = None
+        else:
+            del self.extra[key]
+
+    def __iter__(self):
+        if self.opcode != NO_OPCODE:
+            yield 'op'
+        for key in _SLOT_KEYS:
+            if getattr(self, key) is not None:
+                yield key
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if other.__class__ is Instr:
+            return (self.opcode == other.opcode and self.dest == other.dest
+                    and self.type == other.type and self.args == other.args
+                    and self.funcs == other.funcs
+                    and self.labels == other.labels
+                    and self.value == other.value
+                    and self.label == other.label
+                    and (self.extra or None) == (other.extra or None))
+        if isinstance(other, Mapping):
+            return self.to_bril() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Instr({!r})'.format(self.to_bril())
@@ -0,0 +1,102 @@
+import copy
+import json
+import unittest
+
+from .instr import Instr, OPCODES, intern_opcode
+from .basic_blocks import BBProgram
+from . import parser
+from . import util
+
+
+class InstrTest(unittest.TestCase):
+    def test_roundtrip(self):
+        for d in [{
+                'label': 'somewhere'
+        }, {
+                'dest': 'v',
+                'op': 'const',
+                'type': 'bool',
+                'value': False
+        }, {
+                'args': ['a'],
+                'dest': 'r',
+                'funcs': ['f'],
+                'op': 'call',
+                'type': 'int',
+                'pos': {
+                    'row': 1,
+                    'col': 2
+                }
+        }, {
+                'args': ['c'],
+                'labels': ['then', 'else'],
+                'op': 'br'
+        }]:
+            instr = Instr.from_bril(d)
+            self.assertEqual(instr.to_bril(), d)
+            self.assertEqual(instr, d)
+            self.assertEqual(d, instr)
+            self.assertEqual(instr, copy.deepcopy(instr))
+
+    def test_mapping_interface(self):
+        instr = Instr.from_bril({
+            'args': ['a', 'b'],
+            'dest': 'c',
+            'op': 'add',
+            'type': 'int'
+        })
+        self.assertEqual(instr['op'], 'add')
+        self.assertEqual(instr.opcode, OPCODES['add'])
+        self.assertIn('args', instr)
+        self.assertNotIn('labels', instr)
+        self.assertIsNone(instr.get('value'))
+        self.assertEqual(len(instr), 4)
+        with self.assertRaises(KeyError):
+            instr['labels']
+
+        instr['op'] = 'mul'
+        instr.update({'dest': 'd'})
+        self.assertEqual(instr, {
+            'args': ['a', 'b'],
+            'dest': 'd',
+            'op': 'mul',
+            'type': 'int'
+        })
+
+        c = instr.copy()
+        c['args'].append('e')
+        self.assertEqual(instr['args'], ['a', 'b'])
+
+    def test_unknown_opcodes_are_interned(self):
+        code = intern_opcode('__test_op')
+        self.assertEqual(intern_opcode('__test_op'), code)
+        self.assertEqual(Instr(op='__test_op').op, '__test_op')
+
+    def test_predicates(self):
+        add = Instr(op='add', dest='c', type='int', args=['a', 'b'])
+        div = Instr(op='div', dest='c', type='int', args=['a', 'b'])
+        jmp = util.mkjmp('l')
+        label = util.mklabel('l')
+        self.assertTrue(util.is_value_op(add))
+        self.assertFalse(util.can_have_side_effects(add))
+        self.assertTrue(util.can_have_side_effects(div))
+        self.assertTrue(util.is_terminator(jmp))
+        self.assertTrue(util.is_effect_op(jmp))
+        self.assertFalse(util.is_terminator(label))
+        self.assertTrue(util.is_label(label))
+
+    def test_program_roundtrips_to_json(self):
+        prog = parser.parse("""
+          @main(x: int) {
+            v: int = const 4;
+            br x .a .b;
+            .a:
+            print v;
+            .b:
+          }""")
+        bbprog = BBProgram(prog)
+        self.assertEqual(json.loads(json.dumps(bbprog.bril_dict())), prog)
+
+
+if __name__ == '__main__':
+    unittest.main()
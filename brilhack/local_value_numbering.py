@@ -8,24 +8,140 @@
 # bril, and can be tweaked in different ways to get all of the above
 # optimizations. Usually the tweaks are in form of introducing some semantic
 # awareness of the target language.
+import struct
+
 from . import util
 
 
-def value_key(env, instr):
+def const_key(typ, value):
+    """Returns the value key of a constant `value` of type `typ`."""
+    if typ == 'float':
+        # 0.0 == -0.0 in python, so floats are also keyed on their bits.
+        return ('const', typ, value, struct.pack('<d', value))
+    return ('const', typ, value)
+
+
+# Ops whose value does not depend on the order of their args. Their keys list
+# the value numbers of args in sorted order, so that `add a b` and `add b a`
+# get the same key.
+COMMUTATIVE_OPS = {
+    'add', 'mul', 'eq', 'and', 'or', 'fadd', 'fmul', 'feq', 'ceq'
+}
+
+
+def _wrap_int(n):
+    """Wraps `n` to a signed 64 bit int, as Bril ints overflow."""
+    return (n + 2**63) % 2**64 - 2**63
+
+
+def _int_div(a, b):
+    # Bril int division truncates towards zero, unlike Python's //.
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+# Map from op to a function computing its result from constant args. Ops that
+# would trap (or give an inf/nan) are not folded when their divisor is zero.
+FOLDABLE_OPS = {
+    'add': lambda a, b: _wrap_int(a + b),
+    'sub': lambda a, b: _wrap_int(a - b),
+    'mul': lambda a, b: _wrap_int(a * b),
+    'div': lambda a, b: None if b == 0 else _wrap_int(_int_div(a, b)),
+    'eq': lambda a, b: a == b,
+    'lt': lambda a, b: a < b,
+    'gt': lambda a, b: a > b,
+    'le': lambda a, b: a <= b,
+    'ge': lambda a, b: a >= b,
+    'not': lambda a: not a,
+    'and': lambda a, b: a and b,
+    'or': lambda a, b: a or b,
+    'fadd': lambda a, b: a + b,
+    'fsub': lambda a, b: a - b,
+    'fmul': lambda a, b: a * b,
+    'fdiv': lambda a, b: None if b == 0 else a / b,
+    'feq': lambda a, b: a == b,
+    'flt': lambda a, b: a < b,
+    'fgt': lambda a, b: a > b,
+    'fle': lambda a, b: a <= b,
+    'fge': lambda a, b: a >= b,
+    'ceq': lambda a, b: a == b,
+    'clt': lambda a, b: a < b,
+    'cgt': lambda a, b: a > b,
+    'cle': lambda a, b: a <= b,
+    'cge': lambda a, b: a >= b,
+}
+
+# Map from op to (constant, simplification) pairs: an op with one arg equal to
+# the constant simplifies to its other arg ('arg'), or to a constant. For ops
+# that are not commutative, only the second arg is checked.
+SIMPLIFICATIONS = {
+    'add': [(0, 'arg')],
+    'sub': [(0, 'arg')],
+    'mul': [(1, 'arg'), (0, ('const', 'int', 0))],
+    'div': [(1, 'arg')],
+    'and': [(True, 'arg'), (False, ('const', 'bool', False))],
+    'or': [(False, 'arg'), (True, ('const', 'bool', True))],
+}
+
+
+def _const_value(valtable, num):
+    """Returns (True, value) if the value numbered `num` is a constant, and
+    (False, None) otherwise."""
+    key = valtable[num][0]
+    if key is not None and key[0] == 'const':
+        return True, key[2]
+    return False, None
+
+
+def _fold(valtable, instr, key):
+    """Returns a key equal to `key` computed by `instr` but simpler, or `key`
+    itself. Constant args are folded into a `const` key, and identities like
+    `add x 0` into the key `('id', x)`."""
+    op, nums = key[0], key[1:]
+    consts = [_const_value(valtable, num) for num in nums]
+    if op in FOLDABLE_OPS and all(is_const for is_const, _ in consts):
+        value = FOLDABLE_OPS[op](*(value for _, value in consts))
+        if value is not None:
+            return const_key(instr['type'], value)
+    if op in SIMPLIFICATIONS and len(nums) == 2:
+        positions = (0, 1) if op in COMMUTATIVE_OPS else (1, )
+        for pos in positions:
+            is_const, value = consts[pos]
+            if not is_const:
+                continue
+            for const, simplified in SIMPLIFICATIONS[op]:
+                # Compare types too, as True == 1 in python.
+                if type(value) is type(const) and value == const:
+                    if simplified == 'arg':
+                        return ('id', nums[1 - pos])
+                    return simplified
+    return key
+
+
+def value_key(env, instr, valtable=None):
+    """Returns a key for the value computed by `instr`, given the map `env`
+    from var names to value numbers. If `valtable` is given, the key is
+    simplified by constant folding and algebraic identities."""
     if instr['op'] == 'const':
-        # TODO(yati): Take types into account?
-        return ('const', instr['value'])
+        return const_key(instr.get('type'), instr['value'])
     key = [instr['op']]
     for arg in instr['args']:
         key.append(env[arg])  # Crash ok if arg is not seen before.
-    return tuple(key)
+    if key[0] in COMMUTATIVE_OPS:
+        key[1:] = sorted(key[1:])
+    key = tuple(key)
+    if valtable is not None:
+        key = _fold(valtable, instr, key)
+    return key
 
 
 def reconstruct_instr(valtable, key, dest, instr):
     reconstructed = instr.copy()
     op = key[0]
     if op == 'const':
-        reconstructed.update({'value': key[1], 'dest': dest})
+        reconstructed.update({'op': 'const', 'value': key[2], 'dest': dest})
+        if 'args' in reconstructed:
+            del reconstructed['args']
     else:
         # Assume key ~ (op, arg1_valnum, arg2_valnum, ...)
         reconstructed.update({
@@ -75,7 +191,13 @@ def local_value_numbering_transform(basic_block):
 
     transformed_bb = []
     for idx, instr in enumerate(basic_block):
-        key = value_key(env, instr)
+        for arg in instr.get('args', ()):
+            if arg not in env:
+                # A var defined before the block: its value is unknown, but
+                # can still be reused.
+                env[arg] = len(valtable)
+                valtable.append((None, arg))
+        key = value_key(env, instr, valtable)
         if key in valindex:
             num = valindex[key]
             # Because of the next block in this if ladder, we can never have
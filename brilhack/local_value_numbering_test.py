@@ -16,9 +16,9 @@ class LocalValueNumberingTest(unittest.TestCase):
 
             a__0: int = const 4;
             b__1: int = const 2;
-            s1__2: int = add a__0 b__1;
+            s1__2: int = const 6;
             s2__3: int = id s1__2;
-            m__4: int = mul s1__2 s1__2;
+            m__4: int = const 36;
         """
         block = [{
             "dest": "a",
@@ -63,20 +63,20 @@ class LocalValueNumberingTest(unittest.TestCase):
             "type": "int",
             "value": 2
         }, {
-            "args": ["a__0", "b__1"],
             "dest": "s1__2",
-            "op": "add",
-            "type": "int"
+            "op": "const",
+            "type": "int",
+            "value": 6
         }, {
             "dest": "s2__3",
             "op": "id",
             "type": "int",
             "args": ["s1__2"],
         }, {
-            "args": ["s1__2", "s1__2"],
             "dest": "m__4",
-            "op": "mul",
-            "type": "int"
+            "op": "const",
+            "type": "int",
+            "value": 36
         }, {
             "args": ["m__4"],
             "op": "print"
@@ -96,7 +96,7 @@ class LocalValueNumberingTest(unittest.TestCase):
 
             a__0: int = const 4;
             b__1: int = const 2;
-            x__2: int = add a__0 b__1;
+            x__2: int = const 6;
             x__3: int = const 10;
             y__4: int = id x__2;
             print y;
@@ -145,10 +145,10 @@ class LocalValueNumberingTest(unittest.TestCase):
             "type": "int",
             "value": 2
         }, {
-            "args": ["a__0", "b__1"],
             "dest": "x__2",
-            "op": "add",
-            "type": "int"
+            "op": "const",
+            "type": "int",
+            "value": 6
         }, {
             "value": 10,
             "dest": "x__3",
@@ -180,11 +180,11 @@ class LocalValueNumberingTest(unittest.TestCase):
 
             a__0: int = const 4;
             b__1: int = const 2;
-            x__2: int = add a__0 b__1;
+            x__2: int = const 6;
             y__3: int = id x__2;
             x__4: int = const 10;
             z__5: int = id x__4;
-            s__6: int = add x__4 y__3;
+            s__6: int = add y__3 x__4;
             print s;
         """
         block = [{
@@ -240,10 +240,10 @@ class LocalValueNumberingTest(unittest.TestCase):
             "type": "int",
             "value": 2
         }, {
-            "args": ["a__0", "b__1"],
             "dest": "x__2",
-            "op": "add",
-            "type": "int"
+            "op": "const",
+            "type": "int",
+            "value": 6
         }, {
             "args": ["x__2"],
             "dest": "y__3",
@@ -260,7 +260,7 @@ class LocalValueNumberingTest(unittest.TestCase):
             "op": "id",
             "type": "int"
         }, {
-            "args": ["x__4", "y__3"],
+            "args": ["y__3", "x__4"],
             "dest": "s__6",
             "op": "add",
             "type": "int"
@@ -270,6 +270,247 @@ class LocalValueNumberingTest(unittest.TestCase):
         }
         ])
 
+    def test_commutative_ops_have_the_same_key(self):
+        """Test that the block:
+
+            x: int = add a b;
+            y: int = add b a;
+            z: int = sub b a;
+            print x y z;
+
+        is transformed to:
+
+            x__0: int = add a b;
+            y__1: int = id x__0;
+            z__2: int = sub b a;
+            print x__0 y__1 z__2;
+        """
+        block = [{
+            "args": ["a", "b"],
+            "dest": "x",
+            "op": "add",
+            "type": "int"
+        }, {
+            "args": ["b", "a"],
+            "dest": "y",
+            "op": "add",
+            "type": "int"
+        }, {
+            "args": ["b", "a"],
+            "dest": "z",
+            "op": "sub",
+            "type": "int"
+        }, {
+            "args": ["x", "y", "z"],
+            "op": "print"
+        }]
+        transformed_block = lvn.local_value_numbering_transform(block)
+        self.assertEqual(transformed_block, [{
+            "args": ["a", "b"],
+            "dest": "x__0",
+            "op": "add",
+            "type": "int"
+        }, {
+            "args": ["x__0"],
+            "dest": "y__1",
+            "op": "id",
+            "type": "int"
+        }, {
+            "args": ["b", "a"],
+            "dest": "z__2",
+            "op": "sub",
+            "type": "int"
+        }, {
+            "args": ["x__0", "y__1", "z__2"],
+            "op": "print"
+        }])
+
+    def test_const_keys_include_types(self):
+        self.assertNotEqual(
+            lvn.value_key({}, {
+                "op": "const",
+                "dest": "t",
+                "type": "bool",
+                "value": True
+            }),
+            lvn.value_key({}, {
+                "op": "const",
+                "dest": "i",
+                "type": "int",
+                "value": 1
+            }))
+
+    def test_float_zeros_are_different_values(self):
+        """Test that the block:
+
+            z: float = const 0.0;
+            n: float = const -0.0;
+            m: float = const -1.0;
+            p: float = fmul z m;
+            print z n p;
+
+        is transformed to:
+
+            z__0: float = const 0.0;
+            n__1: float = const -0.0;
+            m__2: float = const -1.0;
+            p__3: float = id n__1;
+            print z__0 n__1 p__3;
+        """
+        block = [{
+            "dest": "z",
+            "op": "const",
+            "type": "float",
+            "value": 0.0
+        }, {
+            "dest": "n",
+            "op": "const",
+            "type": "float",
+            "value": -0.0
+        }, {
+            "dest": "m",
+            "op": "const",
+            "type": "float",
+            "value": -1.0
+        }, {
+            "args": ["z", "m"],
+            "dest": "p",
+            "op": "fmul",
+            "type": "float"
+        }, {
+            "args": ["z", "n", "p"],
+            "op": "print"
+        }]
+        transformed_block = lvn.local_value_numbering_transform(block)
+        self.assertEqual(transformed_block[1]["op"], "const")
+        self.assertEqual(transformed_block[3], {
+            "args": ["n__1"],
+            "dest": "p__3",
+            "op": "id",
+            "type": "float"
+        })
+
+    def test_constant_folding(self):
+        def fold(op, typ, *values):
+            env = {}
+            valtable = []
+            for i, value in enumerate(values):
+                env['v{}'.format(i)] = i
+                valtable.append((('const', None, value), 'v{}'.format(i)))
+            instr = {"op": op, "dest": "r", "type": typ, "args": list(env)}
+            return lvn.value_key(env, instr, valtable)
+
+        self.assertEqual(fold('add', 'int', 2**63 - 1, 1),
+                         ('const', 'int', -2**63))
+        self.assertEqual(fold('div', 'int', -7, 2), ('const', 'int', -3))
+        self.assertEqual(fold('div', 'int', 7, 0), ('div', 0, 1))
+        self.assertEqual(fold('lt', 'bool', 1, 2), ('const', 'bool', True))
+        self.assertEqual(fold('not', 'bool', True), ('const', 'bool', False))
+        self.assertEqual(fold('fmul', 'float', 1.5, 2.0),
+                         lvn.const_key('float', 3.0))
+        self.assertEqual(fold('fdiv', 'float', 1.0, 0.0), ('fdiv', 0, 1))
+        self.assertEqual(fold('cle', 'bool', 'a', 'b'), ('const', 'bool', True))
+
+    def test_identities_are_simplified(self):
+        """Test that the block:
+
+            one: int = const 1;
+            zero: int = const 0;
+            t: bool = const true;
+            x: int = mul a one;
+            y: int = add zero a;
+            z: int = mul a zero;
+            w: int = sub zero a;
+            c: bool = and t p;
+            print x y z w c;
+
+        is transformed to:
+
+            one__0: int = const 1;
+            zero__1: int = const 0;
+            t__2: bool = const true;
+            x__3: int = id a;
+            y__4: int = id x__3;
+            z__5: int = id zero__1;
+            w__6: int = sub zero__1 a;
+            c__7: bool = id p;
+            print x__3 y__4 z__5 w__6 c__7;
+        """
+        block = [{
+            "dest": "one",
+            "op": "const",
+            "type": "int",
+            "value": 1
+        }, {
+            "dest": "zero",
+            "op": "const",
+            "type": "int",
+            "value": 0
+        }, {
+            "dest": "t",
+            "op": "const",
+            "type": "bool",
+            "value": True
+        }, {
+            "args": ["a", "one"],
+            "dest": "x",
+            "op": "mul",
+            "type": "int"
+        }, {
+            "args": ["zero", "a"],
+            "dest": "y",
+            "op": "add",
+            "type": "int"
+        }, {
+            "args": ["a", "zero"],
+            "dest": "z",
+            "op": "mul",
+            "type": "int"
+        }, {
+            "args": ["zero", "a"],
+            "dest": "w",
+            "op": "sub",
+            "type": "int"
+        }, {
+            "args": ["t", "p"],
+            "dest": "c",
+            "op": "and",
+            "type": "bool"
+        }, {
+            "args": ["x", "y", "z", "w", "c"],
+            "op": "print"
+        }]
+        transformed_block = lvn.local_value_numbering_transform(block)
+        self.assertEqual(transformed_block[3:], [{
+            "args": ["a"],
+            "dest": "x__3",
+            "op": "id",
+            "type": "int"
+        }, {
+            "args": ["x__3"],
+            "dest": "y__4",
+            "op": "id",
+            "type": "int"
+        }, {
+            "args": ["zero__1"],
+            "dest": "z__5",
+            "op": "id",
+            "type": "int"
+        }, {
+            "args": ["zero__1", "a"],
+            "dest": "w__6",
+            "op": "sub",
+            "type": "int"
+        }, {
+            "args": ["p"],
+            "dest": "c__7",
+            "op": "id",
+            "type": "bool"
+        }, {
+            "args": ["x__3", "y__4", "z__5", "w__6", "c__7"],
+            "op": "print"
+        }])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,148 @@
+"""Content-addressed on-disk cache of parsed Bril programs.
+
+Entries are keyed by a hash of the parser version, the parser backend and the
+Bril source text, and stored with `marshal`, which loads plain dicts/lists/strings much faster than
+`json`. The cache directory may be shared by several processes: entries are
+written to a temporary file and atomically renamed into place, and an entry
+vanishing underneath a reader (e.g. evicted by another process) is just a miss.
+Temporary files left behind by writers that crashed are removed on eviction.
+
+Usage:
+
+  cache = ParseCache('/tmp/bril-cache', max_bytes=64 * 1024 * 1024)
+  prog = parser.parse(bril_code, cache=cache)
+"""
+import os
+import hashlib
+import marshal
+import tempfile
+import time
+
+from .parser import PARSER_VERSION
+
+_SUFFIX = '.marshal'
+_TMP_SUFFIX = '.tmp'
+
+# Backend of parser.parse() that entries are for, unless given otherwise.
+DEFAULT_BACKEND = 'brilhack'
+
+# Age after which a temporary file is assumed to be left by a crashed writer.
+_STALE_TMP_SECONDS = 60 * 60
+
+
+class ParseCache:
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # Estimate of the bytes used by the cache directory, so that we only
+        # scan it when it may have outgrown max_bytes. Other processes can make
+        # this stale, which is fine: eviction always rescans.
+        self._approx_bytes = None
+
+    def _path(self, bril_code: str, backend=DEFAULT_BACKEND) -> str:
+        h = hashlib.sha256()
+        h.update('{}\0{}\0'.format(PARSER_VERSION, backend).encode())
+        h.update(bril_code.encode())
+        return os.path.join(self.directory, h.hexdigest() + _SUFFIX)
+
+    def get(self, bril_code: str, backend=DEFAULT_BACKEND):
+        """Returns the program for `bril_code` cached by parser `backend`, or
+        None on a miss."""
+        path = self._path(bril_code, backend)
+        try:
+            with open(path, 'rb') as f:
+                prog = marshal.load(f)
+        except FileNotFoundError:
+            return None
+        except (EOFError, ValueError, TypeError):
+            # Corrupt entry, e.g., written by an incompatible Python version.
+            self._remove(path)
+            return None
+        try:
+            # Bump the mtime, which is what LRU eviction goes by.
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return prog
+
+    def put(self, bril_code: str, prog, backend=DEFAULT_BACKEND):
+        data = marshal.dumps(prog)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=_TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(bril_code, backend))
+        except BaseException:
+            self._remove(tmp)
+            raise
+
+        if self._approx_bytes is None:
+            self._approx_bytes = self._total_bytes()
+        else:
+            self._approx_bytes += len(data)
+        if self._approx_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self, target_bytes=None):
+        """Removes least recently used entries until the cache takes up at
+        most `target_bytes` (default: 90% of max_bytes), and stale temporary
+        files."""
+        if target_bytes is None:
+            target_bytes = self.max_bytes * 9 // 10
+        self._remove_stale_tmp_files()
+        entries = []
+        total = 0
+        for entry in self._entries():
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+            total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            self._remove(path)
+            total -= size
+        self._approx_bytes = total
+
+    def clear(self):
+        for entry in self._entries():
+            self._remove(entry.path)
+        self._approx_bytes = 0
+
+    def _entries(self):
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(_SUFFIX):
+                    yield entry
+
+    def _remove_stale_tmp_files(self):
+        cutoff = time.time() - _STALE_TMP_SECONDS
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(_TMP_SUFFIX):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        self._remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _total_bytes(self):
+        total = 0
+        for entry in self._entries():
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from . import parser
+from .parse_cache import ParseCache
+
+PROG1 = "@main { v: int = const 1; print v; }"
+PROG2 = "@main { v: int = const 2; print v; }"
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_warm_parse_skips_parser(self):
+        cache = ParseCache(self.tmpdir.name)
+        self.assertIsNone(cache.get(PROG1))
+        prog = parser.parse(PROG1, cache=cache)
+        self.assertEqual(cache.get(PROG1), prog)
+
+        # A second cache on the same directory, e.g., in a later run.
+        cache = ParseCache(self.tmpdir.name)
+        with mock.patch.object(parser, '_tokenize') as tokenize:
+            self.assertEqual(parser.parse(PROG1, cache=cache), prog)
+            tokenize.assert_not_called()
+
+    def test_key_depends_on_parser_version(self):
+        cache = ParseCache(self.tmpdir.name)
+        parser.parse(PROG1, cache=cache)
+        with mock.patch('brilhack.parse_cache.PARSER_VERSION',
+                        parser.PARSER_VERSION + 1):
+            self.assertIsNone(cache.get(PROG1))
+
+    def test_key_depends_on_backend(self):
+        cache = ParseCache(self.tmpdir.name)
+        prog = parser.parse(PROG1, cache=cache)
+        self.assertIsNone(cache.get(PROG1, 'bril2json'))
+        with mock.patch.object(parser, '_parse_with_bril2json',
+                               return_value={'functions': []}) as bril2json:
+            self.assertEqual(parser.parse(PROG1, use_bril2json=True,
+                                          cache=cache), {'functions': []})
+            bril2json.assert_called_once()
+        self.assertEqual(cache.get(PROG1), prog)
+        self.assertEqual(cache.get(PROG1, 'bril2json'), {'functions': []})
+
+    def test_evicts_least_recently_used(self):
+        cache = ParseCache(self.tmpdir.name)
+        parser.parse(PROG1, cache=cache)
+        parser.parse(PROG2, cache=cache)
+        entry_size = os.path.getsize(cache._path(PROG1))
+        # Make PROG2 the least recently used entry.
+        os.utime(cache._path(PROG1), (2, 2))
+        os.utime(cache._path(PROG2), (1, 1))
+
+        cache.evict(target_bytes=entry_size)
+        self.assertIsNotNone(cache.get(PROG1))
+        self.assertIsNone(cache.get(PROG2))
+
+    def test_evicts_stale_tmp_files(self):
+        cache = ParseCache(self.tmpdir.name)
+        stale = os.path.join(self.tmpdir.name, 'stale.tmp')
+        fresh = os.path.join(self.tmpdir.name, 'fresh.tmp')
+        for path in (stale, fresh):
+            with open(path, 'wb') as f:
+                f.write(b'partial')
+        os.utime(stale, (1, 1))
+        cache.evict()
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+    def test_put_respects_max_bytes(self):
+        cache = ParseCache(self.tmpdir.name, max_bytes=1)
+        parser.parse(PROG1, cache=cache)
+        self.assertIsNone(cache.get(PROG1))
+
+    def test_corrupt_entry_is_a_miss(self):
+        cache = ParseCache(self.tmpdir.name)
+        parser.parse(PROG1, cache=cache)
+        with open(cache._path(PROG1), 'wb') as f:
+            f.write(b'\xff')
+        self.assertIsNone(cache.get(PROG1))
+        self.assertFalse(os.path.exists(cache._path(PROG1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
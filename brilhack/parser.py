@@ -1,15 +1,224 @@
 """Bril parser
 
-This "parser" simply shells out to bril2json and then unmarshals the json as Python data.
-
-Needs bril2json installed and on PATH, see https://github.com/sampsyo/bril.
+Parses the Bril text format into the same JSON-shaped Python data that
+`bril2json` produces, entirely in-process. The original behaviour of shelling
+out to `bril2json` is still available with `parse(..., use_bril2json=True)`,
+which needs bril2json installed and on PATH, see https://github.com/sampsyo/bril.
 """
+import os
 import sys
+import re
 import json
 import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Bump whenever the shape of parse()'s output changes, so that on-disk parse
+# caches (see parse_cache.py) do not serve stale programs.
+PARSER_VERSION = 2
+
+
+class BrilSyntaxError(Exception):
+    pass
+
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+  | (?P<comment>\#[^\n]*)
+  | (?P<char>'(?:\\.|[^'\\])')
+  | (?P<number>-?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?)
+  | (?P<func>@[A-Za-z_%][\w%.]*)
+  | (?P<label>\.[A-Za-z_%][\w%.]*)
+  | (?P<ident>[A-Za-z_%][\w%.]*)
+  | (?P<punct>[(){}:;=,<>])
+  """, re.VERBOSE)
+
+
+# Map from the char after a backslash in a char literal to the char it denotes.
+_CHAR_ESCAPES = {
+    '0': '\0',
+    'a': '\a',
+    'b': '\b',
+    't': '\t',
+    'n': '\n',
+    'v': '\v',
+    'f': '\f',
+    'r': '\r',
+    '\\': '\\',
+    "'": "'",
+    '"': '"',
+}
+
+
+def _tokenize(bril_code: str):
+    """Returns a list of (kind, text, line) tuples for `bril_code`."""
+    tokens = []
+    line = 1
+    pos = 0
+    end = len(bril_code)
+    while pos < end:
+        m = _TOKEN_RE.match(bril_code, pos)
+        if m is None:
+            raise BrilSyntaxError('Unexpected character {!r} on line {}'.format(
+                bril_code[pos], line))
+        kind = m.lastgroup
+        text = m.group()
+        if kind == 'punct':
+            tokens.append((text, text, line))
+        elif kind != 'ws' and kind != 'comment':
+            tokens.append((kind, text, line))
+        line += text.count('\n')
+        pos = m.end()
+    tokens.append(('eof', '', line))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset=0):
+        return self.tokens[self.pos + offset][0]
+
+    def next(self):
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def expect(self, kind):
+        tok = self.next()
+        if tok[0] != kind:
+            raise BrilSyntaxError('Expected {} but found {!r} on line {}'.format(
+                kind, tok[1], tok[2]))
+        return tok[1]
+
+    def program(self):
+        funcs = []
+        while self.peek() != 'eof':
+            funcs.append(self.function())
+        return {'functions': funcs}
+
+    def function(self):
+        name = self.expect('func')[1:]
+        args = []
+        if self.peek() == '(':
+            self.next()
+            while self.peek() != ')':
+                if args:
+                    self.expect(',')
+                argname = self.expect('ident')
+                self.expect(':')
+                args.append({'name': argname, 'type': self.type()})
+            self.next()
+        typ = None
+        if self.peek() == ':':
+            self.next()
+            typ = self.type()
+        self.expect('{')
+        instrs = []
+        while self.peek() != '}':
+            instrs.append(self.instr())
+        self.next()
 
+        func = {'name': name}
+        if args:
+            func['args'] = args
+        if typ is not None:
+            func['type'] = typ
+        func['instrs'] = instrs
+        return func
 
-def parse(bril_code: str):
+    def type(self):
+        name = self.expect('ident')
+        if self.peek() == '<':
+            self.next()
+            param = self.type()
+            self.expect('>')
+            return {name: param}
+        return name
+
+    def instr(self):
+        kind = self.peek()
+        if kind == 'label':
+            label = self.next()[1][1:]
+            self.expect(':')
+            return {'label': label}
+        if kind == 'ident' and self.peek(1) in (':', '='):
+            return self.value_op()
+        return self.effect_op()
+
+    def value_op(self):
+        dest = self.expect('ident')
+        typ = None
+        if self.peek() == ':':
+            self.next()
+            typ = self.type()
+        self.expect('=')
+        if self.peek() == 'ident' and self.tokens[self.pos][1] == 'const':
+            self.next()
+            instr = {'op': 'const', 'dest': dest}
+            if typ is not None:
+                instr['type'] = typ
+            instr['value'] = self.literal()
+            self.expect(';')
+            return instr
+        instr = {'dest': dest}
+        if typ is not None:
+            instr['type'] = typ
+        instr.update(self.operation())
+        return instr
+
+    def effect_op(self):
+        return self.operation()
+
+    def operation(self):
+        op = self.expect('ident')
+        args, funcs, labels = [], [], []
+        while self.peek() != ';':
+            kind, text, line = self.next()
+            if kind == 'ident':
+                args.append(text)
+            elif kind == 'func':
+                funcs.append(text[1:])
+            elif kind == 'label':
+                labels.append(text[1:])
+            else:
+                raise BrilSyntaxError(
+                    'Unexpected {!r} in operands of {} on line {}'.format(
+                        text, op, line))
+        self.next()
+        instr = {'op': op}
+        if args:
+            instr['args'] = args
+        if funcs:
+            instr['funcs'] = funcs
+        if labels:
+            instr['labels'] = labels
+        return instr
+
+    def literal(self):
+        kind, text, line = self.next()
+        if kind == 'number':
+            if '.' in text or 'e' in text or 'E' in text:
+                return float(text)
+            return int(text)
+        if kind == 'ident' and text in ('true', 'false'):
+            return text == 'true'
+        if kind == 'char':
+            char = text[1:-1]
+            if char[0] == '\\':
+                char = _CHAR_ESCAPES.get(char[1])
+                if char is None:
+                    raise BrilSyntaxError(
+                        'Bad escape sequence {} on line {}'.format(text, line))
+            return char
+        raise BrilSyntaxError('Bad literal {!r} on line {}'.format(text, line))
+
+
+def _parse_with_bril2json(bril_code: str):
     bril2json = subprocess.Popen(["bril2json"],
                                  stdin=subprocess.PIPE,
                                  stdout=subprocess.PIPE,
@@ -24,5 +233,54 @@ def parse(bril_code: str):
     return json.loads(stdout)
 
 
+def parse(bril_code: str, use_bril2json=False, cache=None):
+    """Parses Bril text into a program dict, as `bril2json` would.
+
+    If `use_bril2json` is set, the bril2json executable is used instead of the
+    in-process parser. If a `cache` (a parse_cache.ParseCache) is given, it is
+    consulted first, and updated on a miss.
+    """
+    # The parsers may disagree on some inputs, so each caches its own output.
+    backend = 'bril2json' if use_bril2json else 'brilhack'
+    if cache is not None:
+        prog = cache.get(bril_code, backend)
+        if prog is not None:
+            return prog
+    if use_bril2json:
+        prog = _parse_with_bril2json(bril_code)
+    else:
+        prog = _Parser(_tokenize(bril_code)).program()
+    if cache is not None:
+        cache.put(bril_code, prog, backend)
+    return prog
+
+
+# Outcome of parsing one source in `parse_many`: exactly one of `prog` and
+# `error` is not None.
+ParseResult = namedtuple('ParseResult', ['prog', 'error'])
+
+
+def _parse_one(bril_code, use_bril2json, cache):
+    try:
+        return ParseResult(
+            parse(bril_code, use_bril2json=use_bril2json, cache=cache), None)
+    except Exception as e:
+        return ParseResult(None, e)
+
+
+def parse_many(sources, max_workers=None, use_bril2json=False, cache=None):
+    """Parses each of `sources`, returning a list of ParseResults in input
+    order. A failure to parse one source does not affect the others.
+
+    With `use_bril2json`, up to `max_workers` bril2json processes run
+    concurrently (default: one per CPU). The in-process parser is CPU bound, so
+    it runs the sources one after the other in the calling thread.
+    """
+    if not use_bril2json:
+        return [_parse_one(src, False, cache) for src in sources]
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        return list(pool.map(lambda src: _parse_one(src, True, cache), sources))
+
+
 if __name__ == '__main__':
-    parse(sys.stdin.read())
+    json.dump(parse(sys.stdin.read()), sys.stdout)
@@ -0,0 +1,157 @@
+import unittest
+from . import parser
+
+
+class ParserTest(unittest.TestCase):
+    def test_parse_function(self):
+        prog = parser.parse("""
+          # Comments are skipped.
+          @main(x: int, p: ptr<float>) {
+            v: int = const 4;
+            b: bool = const true;
+            f: float = const -1.5;
+            s: int = add v x;
+            r: int = call @square s;
+            br b .somewhere .end;
+            .somewhere:
+            print s r;
+            .end:
+            ret;
+          }""")
+        self.assertEqual(
+            prog, {
+                'functions': [{
+                    'name':
+                    'main',
+                    'args': [{
+                        'name': 'x',
+                        'type': 'int'
+                    }, {
+                        'name': 'p',
+                        'type': {
+                            'ptr': 'float'
+                        }
+                    }],
+                    'instrs': [
+                        {
+                            'dest': 'v',
+                            'op': 'const',
+                            'type': 'int',
+                            'value': 4
+                        },
+                        {
+                            'dest': 'b',
+                            'op': 'const',
+                            'type': 'bool',
+                            'value': True
+                        },
+                        {
+                            'dest': 'f',
+                            'op': 'const',
+                            'type': 'float',
+                            'value': -1.5
+                        },
+                        {
+                            'args': ['v', 'x'],
+                            'dest': 's',
+                            'op': 'add',
+                            'type': 'int'
+                        },
+                        {
+                            'args': ['s'],
+                            'dest': 'r',
+                            'funcs': ['square'],
+                            'op': 'call',
+                            'type': 'int'
+                        },
+                        {
+                            'args': ['b'],
+                            'labels': ['somewhere', 'end'],
+                            'op': 'br'
+                        },
+                        {
+                            'label': 'somewhere'
+                        },
+                        {
+                            'args': ['s', 'r'],
+                            'op': 'print'
+                        },
+                        {
+                            'label': 'end'
+                        },
+                        {
+                            'op': 'ret'
+                        },
+                    ]
+                }]
+            })
+
+    def test_parse_function_without_args(self):
+        prog = parser.parse("""
+          @main {
+            nop;
+          }
+          @square(n: int): int {
+            r: int = mul n n;
+            ret r;
+          }""")
+        self.assertEqual(prog['functions'][0], {
+            'name': 'main',
+            'instrs': [{
+                'op': 'nop'
+            }]
+        })
+        self.assertEqual(prog['functions'][1]['type'], 'int')
+        self.assertEqual(prog['functions'][1]['args'], [{
+            'name': 'n',
+            'type': 'int'
+        }])
+
+    def test_float_exponents(self):
+        prog = parser.parse("""
+          @main {
+            a: float = const 1e3;
+            b: float = const -2.5E-2;
+            c: float = const .5e+1;
+            i: int = const 7;
+          }""")
+        self.assertEqual(
+            [instr['value'] for instr in prog['functions'][0]['instrs']],
+            [1000.0, -0.025, 5.0, 7])
+        self.assertIsInstance(prog['functions'][0]['instrs'][3]['value'], int)
+
+    def test_char_literals(self):
+        prog = parser.parse(r"""
+          @main {
+            a: char = const 'é';
+            b: char = const '\n';
+            c: char = const '\'';
+            d: char = const '\\';
+            e: char = const '\0';
+          }""")
+        self.assertEqual(
+            [instr['value'] for instr in prog['functions'][0]['instrs']],
+            ['é', '\n', "'", '\\', '\0'])
+        with self.assertRaises(parser.BrilSyntaxError):
+            parser.parse(r"@main { c: char = const '\q'; }")
+
+    def test_syntax_error(self):
+        with self.assertRaises(parser.BrilSyntaxError):
+            parser.parse("@main { v: int = const 4 }")
+
+    def test_parse_many_collects_errors_per_item(self):
+        results = parser.parse_many([
+            "@main { v: int = const 1; }",
+            "@main { v: int = const }",
+            "@f { print; }",
+        ])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0].prog['functions'][0]['name'], 'main')
+        self.assertIsNone(results[0].error)
+        self.assertIsNone(results[1].prog)
+        self.assertIsInstance(results[1].error, parser.BrilSyntaxError)
+        self.assertEqual(results[2].prog['functions'][0]['name'], 'f')
+
+
+if __name__ == '__main__':
+    unittest.main()
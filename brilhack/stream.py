@@ -0,0 +1,116 @@
+"""Streaming reader and writer for Bril JSON programs.
+
+`ProgramStream` parses the `functions` array of a Bril JSON program from a file
+incrementally, yielding one function dict at a time, so that peak memory
+depends on the largest function rather than on the whole program.
+`transform_functions` pairs it with a writer that emits each transformed
+function before the next one is read.
+"""
+import json
+from typing import Callable, Dict, Iterator
+
+_WHITESPACE = ' \t\n\r'
+_decoder = json.JSONDecoder()
+
+
+class ProgramStream:
+    def __init__(self, fp, chunk_size=1 << 16):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        # Top-level keys of the program other than 'functions'. Only complete
+        # once functions() is exhausted.
+        self.other = {}
+
+    def _fill(self, min_size=0) -> bool:
+        """Reads more input, dropping what was consumed. Returns False at
+        EOF."""
+        if self.eof:
+            return False
+        chunk = self.fp.read(max(self.chunk_size, min_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Returns the next non-whitespace character, or '' at EOF."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        found = self._peek()
+        if found != char:
+            raise ValueError('Expected {!r} in Bril JSON, found {!r}'.format(
+                char, found))
+        self.pos += 1
+
+    def _value(self):
+        """Decodes the next JSON value."""
+        self._peek()
+        while True:
+            try:
+                val, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Probably a value cut short by the end of the buffer. Read at
+                # least as much again, so that values spanning many chunks are
+                # decoded in amortized linear time.
+                if self._fill(len(self.buf) - self.pos):
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk.
+            if end == len(self.buf) and self._fill(len(self.buf) - self.pos):
+                continue
+            self.pos = end
+            return val
+
+    def functions(self) -> Iterator[Dict]:
+        """Yields the function dicts of the program, in order."""
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == 'functions':
+                self._expect('[')
+                if self._peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._peek() == ']':
+                            self.pos += 1
+                            break
+                        self._expect(',')
+            else:
+                self.other[key] = self._value()
+            if self._peek() == '}':
+                self.pos += 1
+                return
+            self._expect(',')
+
+
+def transform_functions(fin, fout, transform: Callable[[Dict], Dict]):
+    """Reads a Bril JSON program from `fin`, and writes it to `fout` with each
+    function dict f replaced by transform(f), one function at a time."""
+    stream = ProgramStream(fin)
+    fout.write('{"functions": [')
+    for i, func in enumerate(stream.functions()):
+        if i:
+            fout.write(', ')
+        json.dump(transform(func), fout)
+    fout.write(']')
+    for key, val in stream.other.items():
+        fout.write(', {}: {}'.format(json.dumps(key), json.dumps(val)))
+    fout.write('}')
@@ -0,0 +1,68 @@
+import io
+import json
+import unittest
+
+from . import parser
+from .stream import ProgramStream, transform_functions
+
+PROG = parser.parse("""
+  @main(n: int) {
+    v: int = const 12345;
+    f: float = const 0.25;
+    b: bool = const true;
+    print v f b n;
+  }
+  @other {
+    s: int = const -7;
+    print s;
+  }""")
+
+
+class StreamTest(unittest.TestCase):
+    def test_functions_are_read_one_at_a_time(self):
+        big = {
+            'name': 'big',
+            'instrs': [{
+                'op': 'nop'
+            } for _ in range(1000)]
+        }
+        funcs = PROG['functions'] + [big]
+        prog = {'functions': funcs, 'imports': [{'path': 'x.bril'}]}
+        text = json.dumps(prog, indent=2)
+        for chunk_size in (1, 3, 7, 1 << 16):
+            fp = io.StringIO(text)
+            stream = ProgramStream(fp, chunk_size=chunk_size)
+            it = stream.functions()
+            self.assertEqual(next(it), funcs[0])
+            if chunk_size == 1:
+                # The big function has not been read yet.
+                self.assertLess(fp.tell(), len(text) // 4)
+            self.assertEqual(list(it), funcs[1:])
+            self.assertEqual(stream.other, {'imports': [{'path': 'x.bril'}]})
+
+    def test_empty_program(self):
+        for text in ('{}', '{"functions": []}', ' { "functions" : [ ] } '):
+            stream = ProgramStream(io.StringIO(text), chunk_size=2)
+            self.assertEqual(list(stream.functions()), [])
+
+    def test_malformed_program(self):
+        stream = ProgramStream(io.StringIO('{"functions": [{"name": }]}'))
+        with self.assertRaises(ValueError):
+            list(stream.functions())
+
+    def test_transform_functions(self):
+        fin = io.StringIO(json.dumps(PROG))
+        fout = io.StringIO()
+        transform_functions(fin, fout,
+                            lambda func: dict(func, name=func['name'] + '2'))
+        self.assertEqual(
+            json.loads(fout.getvalue()), {
+                'functions': [
+                    dict(PROG['functions'][0], name='main2'),
+                    dict(PROG['functions'][1], name='other2'),
+                ]
+            })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,9 @@
+from .instr import Instr, OPCODES, OPCODE_FLAGS, TERMINATOR, MAY_TRAP, PURE
+
+
 def is_value_op(instr):
+    if instr.__class__ is Instr:
+        return instr.dest is not None
     return 'dest' in instr
 
 
@@ -7,26 +12,45 @@ def is_effect_op(instr):
 
 
 def is_terminator(instr):
+    if instr.__class__ is Instr:
+        return OPCODE_FLAGS[instr.opcode] & TERMINATOR != 0
     return instr.get('op') in ('jmp', 'br')
 
 
 def is_label(instr):
+    if instr.__class__ is Instr:
+        return instr.label is not None
     return 'label' in instr
 
 
 def mklabel(label_name):
-    return {"label": label_name}
+    return Instr(label=label_name)
 
 
 def mkjmp(target):
-    return {"op": "jmp", "labels": [target]}
+    return Instr(op='jmp', labels=[target])
 
 
 def can_have_side_effects(instr):
     """Returns if instr is an effect op OR if it can throw exceptions."""
+    if instr.__class__ is Instr:
+        return (instr.dest is None
+                or OPCODE_FLAGS[instr.opcode] & MAY_TRAP != 0)
     return is_effect_op(instr) or instr['op'] in ('div', )
 
 
+def is_pure(instr):
+    """Returns if instr is a value op computing its result from its args only,
+    with no effects other than possibly throwing exceptions."""
+    if instr.__class__ is Instr:
+        opcode = instr.opcode
+    else:
+        opcode = OPCODES.get(instr.get('op'))
+        if opcode is None:
+            return False
+    return OPCODE_FLAGS[opcode] & PURE != 0
+
+
 def instr_as_string(instr):
     if 'label' in instr:
         return '.{}:'.format(instr['label'])